@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+from utils.sessions import track_session
 
 st.set_page_config(page_title="Introduction", page_icon="🏠")
 
@@ -105,6 +106,7 @@ if not st.session_state["logged"]:
     show_login()
     st.stop()
 else:
+    track_session("Introduction")
     col1, col2, col3 = st.columns([2, 5, 2])
     with col2:
         show_logo_centered()
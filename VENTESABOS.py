@@ -1,33 +1,33 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-from io import BytesIO
-import base64
 import datetime
+from utils.charts import CHART_BACKEND, CHART_BACKENDS, chart, chart_outputs, chart_stats, client_side, show_chart, subplots, vega_bar
+from utils.dates import parse_dates
+from utils.exports import export_buttons, export_stats
+from utils.ingestion import cache_stats, read_upload_or_stop
+from utils.money import parse_amounts
+from utils.recouvrement import commercial_table
+from utils.registry import publish, registry_stats
+from utils.sessions import is_admin, monitor_stats, track_session
 
 # ========== CONFIG ==========
 st.set_page_config(page_title="VENTESABOS BI SUITE", page_icon="📊", layout="wide")
 LOGO_PATH = "logo_fitnesspark.png"
 
 # ========== UTILS ==========
-def to_excel(df_dict):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        for sheet, df in df_dict.items():
-            df.to_excel(writer, sheet_name=sheet, index=True)
-    output.seek(0)
-    return base64.b64encode(output.read()).decode()
+def vega_evolution(evolution):
+    return vega_bar(evolution, "Evolution du recouvrement", "Mois", "Montant recouvert (MAD)", color="#3498db")
 
-def safe_read_csv(file):
-    # Essaye plusieurs encodages
-    for enc in ["utf-8", "cp1252", "latin-1"]:
-        try:
-            file.seek(0)
-            return pd.read_csv(file, encoding=enc, sep=None, engine='python')
-        except Exception:
-            continue
-    st.error("Impossible de lire le fichier CSV. Essayez de l'enregistrer à nouveau en UTF-8 ou Excel.")
-    st.stop()
+@client_side(vega_evolution)
+def plot_evolution(evolution):
+    # Tracé pur : rendu une fois puis servi depuis le cache tant que les données ne changent pas
+    fig, ax = subplots(figsize=(10,4))
+    evolution.plot(kind="bar", color="#3498db", ax=ax)
+    ax.set_ylabel("Montant recouvert (MAD)")
+    ax.set_xlabel("Mois")
+    ax.set_title("Evolution du recouvrement")
+    fig.tight_layout()
+    return fig
 
 # ========== LOGIN ==========
 def show_login():
@@ -47,6 +47,7 @@ def show_login():
     if submit:
         if username == "Admin" and password == "Fpk@2025":
             st.session_state["logged"] = True
+            st.session_state["user"] = username  # identité : index des rejets par utilisateur, droits admin
             st.experimental_rerun()
         else:
             st.error("Identifiants incorrects.")
@@ -55,7 +56,36 @@ def show_logout():
     st.sidebar.markdown("---")
     if st.sidebar.button("Déconnexion"):
         st.session_state["logged"] = False
+        st.session_state.pop("user", None)
         st.experimental_rerun()
+    if is_admin(st.session_state.get("user")):
+        st.sidebar.page_link("pages/96_Memoire_Sessions.py", label="Mémoire des sessions", icon="🧠")
+    # Rendu des graphiques pour toute la session (chaque page peut le changer pour elle-même)
+    libelles = {"matplotlib": "Images (serveur)", "vega": "Interactifs (navigateur)"}
+    courant = st.session_state.get("chart_backend", CHART_BACKEND)
+    st.session_state["chart_backend"] = st.sidebar.radio(
+        "📈 Rendu des graphiques", CHART_BACKENDS, index=CHART_BACKENDS.index(courant), format_func=libelles.get
+    )
+    with st.sidebar.expander("⚙️ Caches"):
+        parse, charts, exports, registry = cache_stats(), chart_stats(), export_stats(), registry_stats()
+        sessions = monitor_stats()
+        st.caption(f"Fichiers : {parse['entries']} en cache, {parse['bytes'] / 2**20:.0f} Mo, succès {parse['hit_rate']:.0%}")
+        st.caption(
+            f"Graphiques : {charts['entries']} en cache, {charts['bytes'] / 2**20:.1f} Mo, succès {charts['hit_rate']:.0%}, "
+            f"{charts['renders']} rendus ({charts['avg_render_ms']:.0f} ms en moyenne)"
+        )
+        st.caption(
+            f"Exports : {exports['entries']} en cache, {exports['bytes'] / 2**20:.1f} Mo, {exports['builds']} classeurs écrits, "
+            f"{exports['rows_per_s']:,.0f} lignes/s, pic mémoire {exports['peak_mb']:.0f} Mo"
+        )
+        st.caption(
+            f"Résultats publiés : {registry['results']} dans {registry['sessions']} session(s), {registry['bytes'] / 2**20:.0f} Mo "
+            f"sur {registry['max_bytes'] / 2**20:.0f}, {registry['spilled']} sur disque"
+        )
+        st.caption(
+            f"Sessions : {sessions['sessions']} suivies, {sessions['compactions']} compactées après "
+            f"{sessions['idle_minutes']:g} min d'inactivité, {sessions['freed_bytes'] / 2**20:.0f} Mo libérés"
+        )
 
 def show_header():
     st.markdown(
@@ -77,9 +107,7 @@ def vue_abos():
     if not file:
         st.info("Importez un fichier de ventes pour démarrer.")
         return
-    ext = file.name.split('.')[-1]
-    df = safe_read_csv(file) if ext == "csv" else pd.read_excel(file, engine="openpyxl")
-    df.columns = df.columns.str.strip()
+    df = read_upload_or_stop(file)
     offres_col = st.selectbox("Colonne des Offres", options=df.columns.tolist(), index=min(5, len(df.columns)-1))
     date_col = st.selectbox("Colonne Date de création", options=df.columns.tolist(), index=min(6, len(df.columns)-1))
     comm_col = st.selectbox("Colonne Commercial", options=df.columns.tolist(), index=min(11, len(df.columns)-1))
@@ -94,7 +122,7 @@ def vue_abos():
         table_club = df.groupby(offres_col).size().to_frame("Quantité").sort_values("Quantité", ascending=False)
         st.dataframe(table_club)
         st.subheader("Ventes par semaine (Club)")
-        df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
+        df[date_col] = parse_dates(df[date_col])
         table_week = df.groupby(df[date_col].dt.to_period('W'))[offres_col].value_counts().unstack().fillna(0)
         st.dataframe(table_week)
     with tabs[1]:
@@ -105,8 +133,9 @@ def vue_abos():
         week_com = df.groupby([df[date_col].dt.to_period('W'), comm_col]).size().unstack(fill_value=0)
         st.dataframe(week_com)
     st.markdown("#### 📥 Export (Excel)")
-    excel_data = to_excel({"Tableau Club": table_club, "Tableau Commercial": table_com, "Par Semaine Club": table_week, "Par Semaine Com": week_com})
-    st.download_button("Télécharger tout (Excel)", base64.b64decode(excel_data), file_name="analyse_abos.xlsx")
+    export_dict = {"Tableau Club": table_club, "Tableau Commercial": table_com, "Par Semaine Club": table_week, "Par Semaine Com": week_com}
+    publish("Accueil", export_dict)
+    export_buttons("Télécharger tout (Excel)", export_dict, "analyse_abos.xlsx")
 
 # ========== VUE RECOUVREMENT ==========
 def vue_recouvrement():
@@ -117,22 +146,13 @@ def vue_recouvrement():
     if not recouv_file:
         st.info("Importe un fichier de recouvrement pour afficher les analyses.")
         return
-    ext = recouv_file.name.split('.')[-1]
-    df_recouv = safe_read_csv(recouv_file) if ext == "csv" else pd.read_excel(recouv_file)
-    df_recouv.columns = df_recouv.columns.str.strip()
+    df_recouv = read_upload_or_stop(recouv_file)
     montant_col = "Montant de l'incident"
     reglement_col = "Règlement de l'incident"
     avoir_col = "Règlement avoir de l'incident"
     commercial_col = "Prénom du commercial initial"
     # --- Nettoyage du montant (float ready) ---
-    df_recouv[montant_col] = (
-        df_recouv[montant_col]
-        .astype(str)
-        .str.replace(" ", "", regex=False)
-        .str.replace(",", ".", regex=False)
-        .str.replace("\u202f", "", regex=False)
-    )
-    df_recouv[montant_col] = pd.to_numeric(df_recouv[montant_col], errors="coerce").fillna(0)
+    df_recouv[montant_col] = parse_amounts(df_recouv[montant_col]).fillna(0)
     # Statut recouvert = au moins une des 2 colonnes remplie (R ou S)
     df_recouv["Recouvert"] = df_recouv[reglement_col].notna() | df_recouv[avoir_col].notna()
     total_rejets = len(df_recouv)
@@ -159,39 +179,26 @@ def vue_recouvrement():
     })
     st.dataframe(table_club)
     st.markdown("## 🧑‍💼 Vue par Commercial initial")
-    table_com = df_recouv.groupby(commercial_col).agg(
-        Total_Rejets = (montant_col, 'count'),
-        Recouvert = ("Recouvert", 'sum'),
-        À_Recouvrir = (montant_col, lambda x: x.isna().sum()),
-        Montant_Total = (montant_col, 'sum'),
-        Montant_Recouvert = (montant_col, lambda x: df_recouv.loc[x.index][df_recouv.loc[x.index,"Recouvert"]][montant_col].sum()),
-        Montant_Impaye = (montant_col, lambda x: df_recouv.loc[x.index][~df_recouv.loc[x.index,"Recouvert"]][montant_col].sum()),
+    table_com = commercial_table(
+        df_recouv, commercial_col, montant_col,
+        columns=("Total_Rejets", "Recouvert", "À_Recouvrir", "Montant_Total", "Montant_Recouvert", "Montant_Impaye"),
     )
     st.dataframe(table_com)
     st.markdown("## 📈 Evolution du recouvrement (valeur recouvrée par mois)")
-    df_recouv["Date_Regl"] = pd.to_datetime(df_recouv[reglement_col], errors='coerce')
+    df_recouv["Date_Regl"] = parse_dates(df_recouv[reglement_col])
     evolution = df_recouv[df_recouv["Recouvert"]].groupby(df_recouv["Date_Regl"].dt.to_period('M'))[montant_col].sum()
-    evolution.plot(kind="bar", figsize=(10,4), color="#3498db")
-    plt.ylabel("Montant recouvert (MAD)")
-    plt.xlabel("Mois")
-    plt.title("Evolution du recouvrement")
-    plt.tight_layout()
-    st.pyplot(plt.gcf())
-    plt.clf()
+    show_chart(chart_outputs([chart(plot_evolution, evolution)], st.session_state["chart_backend"])[0])
     export_dict_rcv = {
         "Tableau Club Recouvrement": table_club,
         "Tableau Commerciaux Recouvrement": table_com,
         "Evolution recouvrement": evolution.to_frame("Montant Recouvert")
     }
-    excel_data = to_excel(export_dict_rcv)
-    st.download_button(
-        label="📥 Télécharger analyse Recouvrement (Excel)",
-        data=base64.b64decode(excel_data),
-        file_name="analyse_recouvrement.xlsx"
-    )
+    publish("Accueil", export_dict_rcv)
+    export_buttons("📥 Télécharger analyse Recouvrement (Excel)", export_dict_rcv, "analyse_recouvrement.xlsx")
 
 # ========== APP PRINCIPALE ==========
 def main():
+    track_session("Tableau de bord")
     show_header()
     show_logout()
     onglets = st.tabs(["Ventes Abos", "Recouvrement"])
@@ -1,8 +1,10 @@
 import streamlit as st
 import pandas as pd
-import requests
-import re
+from utils.images import DuckDuckGoFetcher, ImageStore, ThumbnailPrefetcher
+from utils.ingestion import read_upload_or_stop
+from utils.sessions import track_session
 
+track_session("Catalogue")
 st.title("📦 Boutique Produits & Podium des ventes")
 
 # --- UPLOAD FICHIER ---
@@ -12,25 +14,9 @@ if not uploaded_file:
     st.stop()
 
 # --- LECTURE FICHIER ---
-@st.cache_data(show_spinner=False)
-def safe_read_any(file):
-    name = file.name.lower()
-    if name.endswith(".csv"):
-        for enc in ["utf-8", "cp1252", "latin-1"]:
-            try:
-                file.seek(0)
-                return pd.read_csv(file, encoding=enc)
-            except Exception:
-                continue
-    else:
-        return pd.read_excel(file, engine="openpyxl")
-    st.error("Impossible de lire le fichier.")
-    st.stop()
-
-df = safe_read_any(uploaded_file)
+df = read_upload_or_stop(uploaded_file, "Impossible de lire le fichier.")
 
-# --- NORMALISATION COLONNES ---
-df.columns = [c.strip() for c in df.columns]
+# --- COLONNES ---
 code_col = df.columns[15]  # P = index 15
 montant_col = df.columns[16]  # Q = index 16
 etat_col = df.columns[5]  # F = index 5
@@ -52,55 +38,67 @@ df = df[df[montant_col] > 0]
 ca_par_produit = df.groupby(code_col)[montant_col].sum().sort_values(ascending=False)
 qte_par_produit = df.groupby(code_col)[montant_col].count().sort_values(ascending=False)
 
-# --- FONCTION IMAGE ---
-@st.cache_data(show_spinner=False)
-def get_image_url(product_name):
-    try:
-        search_url = "https://duckduckgo.com/"
-        params = {"q": product_name}
-        res = requests.post(search_url, data=params, timeout=10)
-        searchObj = re.search(r'vqd=([\d-]+)\&', res.text, re.M|re.I)
-        if not searchObj:
-            return None
-        vqd = searchObj.group(1)
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        params = (
-            ('l', 'fr-fr'),
-            ('o', 'json'),
-            ('q', product_name),
-            ('vqd', vqd),
-            ('f', ',,,'),
-            ('p', '1'),
-            ('v7exp', 'a')
-        )
-        resp = requests.get("https://duckduckgo.com/i.js", headers=headers, params=params, timeout=10)
-        data = resp.json()
-        if "results" in data and len(data["results"]) > 0:
-            return data["results"][0]["image"]
-        else:
-            return None
-    except Exception:
-        return None
+# --- IMAGES (vignettes sur disque, préchargées en arrière-plan) ---
+# Temps maximal d'attente des images par affichage ; au-delà, emplacements vides
+IMAGE_BUDGET_S = 1.5
+
+@st.cache_resource
+def get_prefetcher():
+    # Un seul pool de téléchargement partagé par toutes les sessions
+    return ThumbnailPrefetcher(ImageStore(), DuckDuckGoFetcher())
 
 # --- ONGLET INTERFACE ---
 tabs = st.tabs(["Boutique", "Podium des ventes"])
 
 # --- 1. BOUTIQUE (avec photos) ---
+# Seule la page affichée est construite : images et éléments pour PAR_PAGE produits max
+TRIS = {
+    "Chiffre d'affaires": ("CA", False),
+    "Quantité vendue": ("Quantité", False),
+    "Nom du produit": ("Produit", True),
+}
+
+def filtrer_catalogue(recherche, tri):
+    catalogue = pd.DataFrame({"CA": ca_par_produit, "Quantité": qte_par_produit.reindex(ca_par_produit.index)})
+    catalogue = catalogue.rename_axis("Produit").reset_index()
+    if recherche:
+        catalogue = catalogue[catalogue["Produit"].str.contains(recherche, case=False, regex=False)]
+    col, asc = TRIS[tri]
+    return catalogue.sort_values(col, ascending=asc, kind="stable", ignore_index=True)
+
 with tabs[0]:
     st.subheader("🛒 Tous les produits")
-    produits = ca_par_produit.index.tolist()
+    c1, c2, c3 = st.columns([3, 2, 1])
+    recherche = c1.text_input("🔎 Rechercher un produit", "").strip()
+    tri = c2.selectbox("Trier par", list(TRIS))
+    par_page = c3.selectbox("Par page", [12, 24, 48], index=1)
+    catalogue = filtrer_catalogue(recherche, tri)
+    nb_pages = max(1, -(-len(catalogue) // par_page))
+    page = st.number_input(f"Page (sur {nb_pages})", min_value=1, max_value=nb_pages, value=1, step=1)
+    visibles = catalogue.iloc[(page - 1) * par_page:page * par_page]
+    st.caption(f"{len(catalogue)} produit(s) — affichage {len(visibles)} sur cette page")
+
+    prefetcher = get_prefetcher()
+    en_cours = prefetcher.request(visibles["Produit"].tolist())
+    if en_cours:
+        en_cours = prefetcher.wait(IMAGE_BUDGET_S)
+    if prefetcher.breaker.is_open:
+        st.caption("📴 Recherche d'images suspendue (service injoignable), nouvel essai dans quelques minutes.")
+    elif en_cours:
+        st.caption(f"⏳ {en_cours} image(s) en cours de chargement…")
+        st.button("🔄 Actualiser les images")
     cols = st.columns(3)
-    for idx, produit in enumerate(produits):
+    for idx, row in enumerate(visibles.itertuples(index=False)):
         col = cols[idx % 3]
         with col:
-            st.markdown(f"**{produit}**")
-            url_img = get_image_url(str(produit))
-            if url_img:
-                st.image(url_img, width=150, caption=f"{produit}")
+            st.markdown(f"**{row.Produit}**")
+            img_path = prefetcher.store.get(row.Produit)
+            if img_path:
+                st.image(img_path, width=150, caption=f"{row.Produit}")
             else:
-                st.write(":x: Image non trouvée")
-            st.caption(f"Quantité vendue : {qte_par_produit[produit]}")
-            st.caption(f"Chiffre d'affaires : {ca_par_produit[produit]:,.0f} MAD")
+                st.write("🖼️ Image non disponible")
+            st.caption(f"Quantité vendue : {row.Quantité}")
+            st.caption(f"Chiffre d'affaires : {row.CA:,.0f} MAD")
 
 # --- 2. PODIUM ---
 with tabs[1]:
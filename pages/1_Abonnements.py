@@ -1,35 +1,52 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from io import BytesIO
-import base64
 from datetime import datetime
+from utils.charts import backend_toggle, chart, chart_outputs, client_side, show_chart, subplots, vega_bar, vega_line
+from utils.dates import parse_dates
+from utils.exports import export_buttons
+from utils.registry import publish
+from utils.ingestion import file_bytes, read_upload_or_stop, upload_fingerprint
+from utils.streaming import STREAMING_THRESHOLD_MB, count_sales, key_labels, read_header, stream_counts
+from utils.sessions import track_session
 
 # ========== PROTECTION LOGIN ==========
 if "logged" not in st.session_state or not st.session_state["logged"]:
     st.warning("Vous devez vous connecter depuis la page d'accueil.")
     st.stop()
 
+track_session("Abonnements")
 st.title("📈 Analyse Ventes Abonnements Fitness Park")
 
-def to_excel(df_dict):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        for sheet, df in df_dict.items():
-            df.to_excel(writer, sheet_name=sheet, index=True)
-    output.seek(0)
-    return base64.b64encode(output.read()).decode()
-
-def safe_read_csv(file):
-    for enc in ["utf-8", "cp1252", "latin-1"]:
-        try:
-            file.seek(0)
-            return pd.read_csv(file, encoding=enc, sep=None, engine='python')
-        except Exception:
-            continue
-    st.error("Impossible de lire le fichier CSV. Essayez de l'enregistrer à nouveau en UTF-8 ou Excel.")
-    st.stop()
+@st.cache_data(show_spinner="Agrégation du fichier par morceaux...", max_entries=4)
+def load_counts(key, offres_col, comm_col, date_col, _data):
+    # `key` = empreinte du fichier : le contenu lui-même n'est pas haché par Streamlit
+    return stream_counts(_data, offres_col, comm_col, date_col)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_sales_counts(key, offres_col, comm_col, date_col, _df):
+    # Comptages une fois par fichier et choix de colonnes : les filtres ne font que sélectionner des lignes
+    return count_sales(_df, offres_col, comm_col, date_col)
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def load_client_visits(key, nom_col, prenom_col, lastpass_col, comm_col, offres_col, _df):
+    # Dernier passage par (client, offre, commercial), dates parsées une seule fois par fichier (lecture seule)
+    clients = pd.DataFrame({
+        'Nom complet': _df[nom_col].astype(str).str.strip() + ' ' + _df[prenom_col].astype(str).str.strip(),
+        offres_col: key_labels(_df[offres_col]),
+        comm_col: key_labels(_df[comm_col]),
+        'Dernier passage dt': parse_dates(_df[lastpass_col]),
+    }).dropna(subset=['Dernier passage dt'])
+    # Première ligne du max par groupe, dans l'ordre du fichier : même commercial retenu en cas d'égalité
+    last = clients.groupby(['Nom complet', offres_col, comm_col], sort=False)['Dernier passage dt'].idxmax()
+    return clients.loc[last].sort_index()
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_last_visits(key, offres_col, comm_col, filtre_offre, filtre_com, _visits):
+    # Dernier passage par client (nom complet) et commercial correspondant, sur les offres/commerciaux filtrés
+    visits = _visits[_visits[offres_col].isin(filtre_offre) & _visits[comm_col].isin(filtre_com)]
+    last = visits.groupby('Nom complet')['Dernier passage dt'].idxmax()
+    return visits.loc[last, ['Nom complet', comm_col, 'Dernier passage dt']].reset_index(drop=True)
 
 def match_col(cols, targets):
     """Matching exact sans accents ni case ni espaces."""
@@ -46,9 +63,20 @@ if not file:
     st.info("Importez un fichier pour démarrer l'analyse.")
     st.stop()
 
-ext = file.name.split('.')[-1]
-df = safe_read_csv(file) if ext == "csv" else pd.read_excel(file, engine="openpyxl")
-df.columns = df.columns.str.strip()
+data = file_bytes(file)
+streaming = False
+if file.name.lower().endswith(".csv"):
+    streaming = st.checkbox(
+        "⚡ Mode streaming (gros exports CSV)",
+        value=len(data) > STREAMING_THRESHOLD_MB * 1024 * 1024,
+        help="Lecture par morceaux : seuls les comptages (offre, commercial, jour) sont gardés en mémoire. L'analyse des inactifs n'est pas disponible dans ce mode.",
+    )
+key = upload_fingerprint(file)
+if streaming:
+    df = pd.DataFrame(columns=read_header(data))  # en-têtes seulement
+else:
+    # Lecture seule (pas de copie à chaque rerun) : comptages et passages clients sont mis en cache
+    df = read_upload_or_stop(file, copy=False)
 
 # -- Auto-matching exact --
 col_candidats_offres = [
@@ -85,27 +113,34 @@ nom_col = st.selectbox("Colonne Nom", options=df.columns.tolist(), index=df.colu
 prenom_col = st.selectbox("Colonne Prénom", options=df.columns.tolist(), index=df.columns.get_loc(prenom_col) if prenom_col in df.columns else 0)
 lastpass_col = st.selectbox("Colonne Dernier Passage", options=df.columns.tolist(), index=df.columns.get_loc(lastpass_col) if lastpass_col in df.columns else 0)
 
+# --- Comptages (offre, commercial, jour) : base de tous les tableaux et graphiques ---
+if streaming:
+    counts = load_counts(key, offres_col, comm_col, date_col, data)
+else:
+    counts = load_sales_counts(key, offres_col, comm_col, date_col, df)
+
 # --- Filtres dynamiques ---
 st.subheader("🎛️ Filtres dynamiques")
-offres_uniques = df[offres_col].dropna().unique().tolist()
-commerciaux_uniques = df[comm_col].dropna().unique().tolist()
+# Libellés en texte dans les comptages (mêmes valeurs en mode streaming ou non)
+offres_uniques = counts[offres_col].dropna().unique().tolist()
+commerciaux_uniques = counts[comm_col].dropna().unique().tolist()
 filtre_offre = st.multiselect("Filtrer par Offre", offres_uniques, offres_uniques)
 filtre_com = st.multiselect("Filtrer par Commercial", commerciaux_uniques, commerciaux_uniques)
-df = df[df[offres_col].isin(filtre_offre) & df[comm_col].isin(filtre_com)]
+counts = counts[counts[offres_col].isin(filtre_offre) & counts[comm_col].isin(filtre_com)].copy()
+counts["Semaine"] = counts["Jour"].dt.to_period('W')
 
 tabs = st.tabs(["📊 Dashboard Club Recouvrement", "🧑‍💼 Dashboard Commercial", "📊Graphiques", "🔴Inactifs"])
 
 # ===== VUE CLUB =====
 with tabs[0]:
     st.subheader("🔵 Tableau Club (quantités)")
-    table_club = df.groupby(offres_col).size().to_frame("Quantité").sort_values("Quantité", ascending=False)
+    table_club = counts.groupby(offres_col)["n"].sum().to_frame("Quantité").sort_values("Quantité", ascending=False)
     # Ligne Total en bas
     table_club.loc['Total'] = table_club['Quantité'].sum()
     st.dataframe(table_club)
 
     st.subheader("📅 Ventes par semaine (Club)")
-    df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
-    table_week = df.groupby(df[date_col].dt.to_period('W'))[offres_col].value_counts().unstack().fillna(0)
+    table_week = counts.groupby(["Semaine", offres_col])["n"].sum().unstack(fill_value=0)
     # Colonne Total à gauche + ligne Total en bas
     table_week['Total'] = table_week.sum(axis=1)
     table_week = table_week[['Total'] + [col for col in table_week.columns if col != 'Total']]
@@ -115,7 +150,7 @@ with tabs[0]:
 # ===== VUE COMMERCIALE =====
 with tabs[1]:
     st.subheader("🟢 Tableau Commercial (quantités)")
-    table_com = df.groupby([comm_col, offres_col]).size().unstack(fill_value=0)
+    table_com = counts.groupby([comm_col, offres_col])["n"].sum().unstack(fill_value=0)
     # Colonne Total à gauche + ligne Total en bas
     table_com['Total'] = table_com.sum(axis=1)
     table_com = table_com[['Total'] + [col for col in table_com.columns if col != 'Total']]
@@ -123,7 +158,7 @@ with tabs[1]:
     st.dataframe(table_com)
 
     st.subheader("📅 Ventes par semaine (par Commercial)")
-    week_com = df.groupby([df[date_col].dt.to_period('W'), comm_col]).size().unstack(fill_value=0)
+    week_com = counts.groupby(["Semaine", comm_col])["n"].sum().unstack(fill_value=0)
     # Colonne Total à gauche + ligne Total en bas
     week_com['Total'] = week_com.sum(axis=1)
     week_com = week_com[['Total'] + [col for col in week_com.columns if col != 'Total']]
@@ -131,70 +166,75 @@ with tabs[1]:
     st.dataframe(week_com)
 
     st.subheader("🗂️ Détail des ventes (Commercial x Offre)")
-    table_com_offre = df.pivot_table(index=comm_col, columns=offres_col, values=date_col, aggfunc="count", fill_value=0)
+    # Ventes avec une date de création valide
+    table_com_offre = counts.groupby([comm_col, offres_col])["n_date"].sum().unstack(fill_value=0)
     # Colonne Total à gauche + ligne Total en bas
     table_com_offre['Total'] = table_com_offre.sum(axis=1)
     table_com_offre = table_com_offre[['Total'] + [col for col in table_com_offre.columns if col != 'Total']]
     table_com_offre.loc['Total'] = table_com_offre.sum()
     st.dataframe(table_com_offre)
 # ===== GRAPHIQUES =====
+# Tracés purs (données en paramètres) : rendus une fois puis servis depuis le cache
+@client_side(vega_bar)
+def plot_bar(data, title, xlabel, ylabel, color=None, stacked=False, figsize=(10, 5)):
+    fig, ax = subplots(figsize=figsize)
+    data.plot(kind="bar", stacked=stacked, color=color, ax=ax)
+    ax.set_ylabel(ylabel)
+    ax.set_xlabel(xlabel)
+    ax.set_title(title)
+    fig.tight_layout()
+    return fig
+
+@client_side(vega_line)
+def plot_line(data, title, xlabel, ylabel, color=None, figsize=(10, 4)):
+    fig, ax = subplots(figsize=figsize)
+    data.plot(color=color, ax=ax)
+    ax.set_ylabel(ylabel)
+    ax.set_xlabel(xlabel)
+    ax.set_title(title)
+    fig.tight_layout()
+    return fig
+
 with tabs[2]:
+    backend = backend_toggle("abos")
+    club_data = counts.groupby(offres_col)["n"].sum().sort_values(ascending=False)
+    pivot = counts.groupby([comm_col, offres_col])["n_date"].sum().unstack(fill_value=0)
+    daily = counts.groupby("Jour")["n"].sum()
+    week_com_pivot = counts.groupby(["Semaine", comm_col])["n"].sum().unstack(fill_value=0)
+    # Les 4 graphiques sont indépendants : rendus en parallèle (ou specs Vega-Lite)
+    g_club, g_pivot, g_daily, g_week = chart_outputs([
+        chart(plot_bar, club_data, "Ventes Club par Offre", "Offre", "Quantité vendue", color="#3498db", figsize=(9, 4)),
+        chart(plot_bar, pivot, "Ventes par Commercial et Offre", "Commercial", "Quantité", stacked=True),
+        chart(plot_line, daily, "Ventes totales par jour", "Date", "Quantité totale", color="#e67e22"),
+        chart(plot_bar, week_com_pivot, "Ventes par commercial par semaine", "Semaine", "Quantité", stacked=True),
+    ], backend)
+
     st.subheader("📊 Graphique : Ventes Club par Offre")
-    club_data = df.groupby(offres_col).size().sort_values(ascending=False)
-    plt.figure(figsize=(9,4))
-    club_data.plot(kind="bar", color="#3498db")
-    plt.ylabel("Quantité vendue")
-    plt.xlabel("Offre")
-    plt.title("Ventes Club par Offre")
-    st.pyplot(plt.gcf())
-    plt.clf()
+    show_chart(g_club)
 
     st.subheader("📊 Graphique : Ventes par Commercial (stacked)")
-    pivot = df.pivot_table(index=comm_col, columns=offres_col, values=date_col, aggfunc="count", fill_value=0)
-    pivot.plot(kind="bar", stacked=True, figsize=(10,5))
-    plt.ylabel("Quantité")
-    plt.xlabel("Commercial")
-    plt.title("Ventes par Commercial et Offre")
-    plt.tight_layout()
-    st.pyplot(plt.gcf())
-    plt.clf()
+    show_chart(g_pivot)
 
     st.subheader("📈 Évolution des ventes (total par jour)")
-    daily = df.groupby(df[date_col].dt.date).size()
-    daily.plot(figsize=(10,4), color="#e67e22")
-    plt.ylabel("Quantité totale")
-    plt.xlabel("Date")
-    plt.title("Ventes totales par jour")
-    plt.tight_layout()
-    st.pyplot(plt.gcf())
-    plt.clf()
+    show_chart(g_daily)
 
     st.subheader("📈 Ventes par commercial par semaine (stacked)")
-    df['Semaine'] = df[date_col].dt.to_period('W')
-    week_com_pivot = df.pivot_table(index='Semaine', columns=comm_col, values=offres_col, aggfunc="count", fill_value=0)
-    week_com_pivot.plot(kind="bar", stacked=True, figsize=(10,5))
-    plt.title("Ventes par commercial par semaine")
-    plt.ylabel("Quantité")
-    plt.xlabel("Semaine")
-    plt.tight_layout()
-    st.pyplot(plt.gcf())
-    plt.clf()
+    show_chart(g_week)
     
 # ===== INACTIFS =====
 with tabs[3]:
     st.subheader("🙅‍♂️ Analyse des clients inactifs")
-    if lastpass_col and nom_col and prenom_col:
-        df['Nom complet'] = df[nom_col].astype(str).str.strip() + ' ' + df[prenom_col].astype(str).str.strip()
-        df['Dernier passage dt'] = pd.to_datetime(df[lastpass_col], dayfirst=True, errors='coerce')
+    if streaming:
+        st.info("Analyse des inactifs indisponible en mode streaming (elle nécessite le détail client). Décochez le mode streaming pour l'afficher.")
+    elif lastpass_col and nom_col and prenom_col:
+        # Table par client calculée une fois par jeu de données/filtres : le slider ne fait qu'un seuil
+        visits = load_client_visits(key, nom_col, prenom_col, lastpass_col, comm_col, offres_col, df)
+        dernier_passage = load_last_visits(
+            (key, nom_col, prenom_col, lastpass_col), offres_col, comm_col, tuple(filtre_offre), tuple(filtre_com), visits,
+        )
         now = pd.to_datetime(datetime.now().date())
         nb_jours = st.slider("Période d'inactivité (jours)", min_value=7, max_value=180, step=1, value=15)
-        dernier_passage = df.groupby('Nom complet')['Dernier passage dt'].max().reset_index()
-        dernier_passage = dernier_passage[dernier_passage['Dernier passage dt'].notna()]
-        dernier_passage['Inactif'] = (now - dernier_passage['Dernier passage dt']).dt.days > nb_jours
-        inactive = dernier_passage[dernier_passage['Inactif']]
-        # Détail commercial
-        last_trans = df.sort_values(['Nom complet','Dernier passage dt']).drop_duplicates('Nom complet', keep='last')
-        inactive_com = inactive.merge(last_trans[['Nom complet',comm_col,'Dernier passage dt']], on=['Nom complet','Dernier passage dt'], how='left')
+        inactive_com = dernier_passage[(now - dernier_passage['Dernier passage dt']).dt.days > nb_jours]
         res_inactif = inactive_com.groupby(comm_col)['Nom complet'].count().reset_index().rename(
             columns={'Nom complet':f'Nb clients inactifs (> {nb_jours}j)', comm_col:"Commercial"}
         ).sort_values(f'Nb clients inactifs (> {nb_jours}j)', ascending=False)
@@ -214,9 +254,5 @@ export_dict = {
     "Par Semaine Club": table_week,
     "Par Semaine Com": week_com,
 }
-excel_data = to_excel(export_dict)
-st.download_button(
-    label="Télécharger tout (Excel)",
-    data=base64.b64decode(excel_data),
-    file_name="analyse_abos.xlsx"
-)
+publish("Abonnements", export_dict)
+export_buttons("Télécharger tout (Excel)", export_dict, "analyse_abos.xlsx")
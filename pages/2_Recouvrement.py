@@ -1,14 +1,21 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from io import BytesIO
-import base64
+from utils.charts import backend_toggle, chart, chart_outputs, client_side, show_chart, subplots, vega_bar, vega_pie
+from utils.dates import parse_dates
+from utils.exports import export_buttons
+from utils.registry import publish
+from utils.ingestion import read_upload_or_stop
+from utils.money import parse_amounts
+from utils.recouvrement import commercial_table
+from utils.rejets import RejectionIndex, load_index, save_index
+from utils.sessions import replace_session_object, session_object, track_session
 
 if "logged" not in st.session_state or not st.session_state["logged"]:
     st.warning("Vous devez vous connecter depuis la page d'accueil.")
     st.stop()
 
+track_session("Recouvrement")
 st.title("💰 Dashboard Recouvrement Fitness Park")
 
 def fmt_mad(val):
@@ -17,24 +24,6 @@ def fmt_mad(val):
     except:
         return val
 
-def to_excel(df_dict):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        for sheet, df in df_dict.items():
-            df.to_excel(writer, sheet_name=sheet, index=True)
-    output.seek(0)
-    return base64.b64encode(output.read()).decode()
-
-def safe_read_csv(file):
-    for enc in ["utf-8", "cp1252", "latin-1"]:
-        try:
-            file.seek(0)
-            return pd.read_csv(file, encoding=enc, sep=None, engine='python')
-        except Exception:
-            continue
-    st.error("Impossible de lire le fichier CSV. Essayez de l'enregistrer à nouveau en UTF-8 ou Excel.")
-    st.stop()
-
 def match_col(cols, targets):
     def norm(x): return x.strip().lower().replace('é','e').replace('è','e').replace('ê','e').replace("’","'").replace("_", " ").replace("-", " ")
     normed = {norm(c):c for c in cols}
@@ -44,32 +33,87 @@ def match_col(cols, targets):
             return normed[t_norm]
     return None
 
+# === GRAPHIQUES (tracés purs, servis depuis le cache si les données n'ont pas changé) ===
+def vega_taux(taux):
+    couleurs = [("#ff0000" if v<50 else "#ff8800" if v<60 else "#37c759") for v in taux]
+    return vega_bar(taux, "Taux de recouvrement par commercial", "Commercial", "Taux de recouvrement (%)", color=couleurs, ylim=(0, 100))
+
+@client_side(vega_pie)
+def plot_pie(values, labels, colors, total=None):
+    # total renseigné : étiquettes en MAD au lieu de pourcentages
+    autopct = (lambda p: fmt_mad(p * total / 100)) if total is not None else '%1.1f%%'
+    fig, ax = subplots(figsize=(5, 5))
+    ax.pie(values, labels=labels, autopct=autopct, colors=colors, startangle=90, textprops={'fontsize': 14})
+    ax.axis('equal')
+    return fig
+
+@client_side(vega_taux)
+def plot_taux(taux):
+    fig, ax = subplots(figsize=(9,4))
+    taux.plot(kind="bar", color=[("#ff0000" if v<50 else "#ff8800" if v<60 else "#37c759") for v in taux], ax=ax)
+    ax.set_title("Taux de recouvrement par commercial")
+    ax.set_xlabel("Commercial")
+    ax.set_ylabel("Taux de recouvrement (%)")
+    ax.set_ylim(0, 100)
+    fig.tight_layout()
+    return fig
+
+def plot_part(montants, parts):
+    fig, ax = subplots(figsize=(10,5))
+    bars = ax.bar(montants.index, montants, color="#2d8ee3")
+    ax.set_title("Part du montant recouvert par commercial")
+    ax.set_xlabel("Commercial")
+    ax.set_ylabel("Montant recouvert (MAD)")
+    ax.tick_params(axis="x", labelrotation=45)
+    fig.tight_layout()
+    for bar, value, part in zip(bars, montants, parts):
+        ax.text(bar.get_x() + bar.get_width()/2, bar.get_height(), f"{fmt_mad(value)}\n({part:.1f}%)", ha='center', va='bottom', fontsize=10)
+    return fig
+
+def plot_rejets(labels, incidents, recouverts):
+    x = np.arange(len(labels))
+    width = 0.35
+
+    fig, ax = subplots(figsize=(10,5))
+    rects1 = ax.bar(x - width/2, incidents, width, label='Nb rejets', color='#e74c3c')
+    rects2 = ax.bar(x + width/2, recouverts, width, label='Nb recouverts', color='#27ae60')
+
+    ax.set_ylabel('Quantité')
+    ax.set_xlabel('Commercial')
+    ax.set_title('Nombre de rejets & rejets recouverts par commercial')
+    ax.set_xticks(x)
+    ax.set_xticklabels(labels, rotation=45)
+    ax.legend()
+
+    for rect in list(rects1) + list(rects2):
+        height = rect.get_height()
+        ax.annotate(f'{int(height)}',
+                    xy=(rect.get_x() + rect.get_width() / 2, height),
+                    xytext=(0, 3),
+                    textcoords="offset points",
+                    ha='center', va='bottom', fontsize=9)
+
+    fig.tight_layout()
+    return fig
+
 # === UPLOAD GLOBAL (une seule fois pour les deux tabs) ===
 recouv_file = st.file_uploader("Fichier Recouvrement (CSV ou Excel)", type=["csv", "xlsx"], key="recouv_file_unique")
 if not recouv_file:
     st.info("Merci d'importer le fichier de recouvrement pour accéder aux dashboards.")
     st.stop()
-ext = recouv_file.name.split('.')[-1]
-df = safe_read_csv(recouv_file) if ext == "csv" else pd.read_excel(recouv_file, engine="openpyxl")
-df.columns = df.columns.str.strip()
+df = read_upload_or_stop(recouv_file)
 
 montant_col = match_col(df.columns, ["Montant de l'incident", "Montant", "M"])
 reglement_col = match_col(df.columns, ["Règlement de l'incident", "Reglement", "R"])
 avoir_col = match_col(df.columns, ["Règlement avoir de l'incident", "Avoir", "S"])
 commercial_col = match_col(df.columns, ["Prénom du commercial initial", "Commercial", "X"])
 
-for col in [montant_col]:
-    df[col] = (
-        df[col].astype(str)
-        .str.replace(" ", "", regex=False)
-        .str.replace(",", ".", regex=False)
-        .str.replace("\u202f", "", regex=False)
-    )
-    df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+df[montant_col] = parse_amounts(df[montant_col]).fillna(0)
 
 df["Recouvert"] = df[reglement_col].notna() | df[avoir_col].notna()
 
 # === TABS ===
+backend = backend_toggle("recouvrement")
 tabs = st.tabs(["📊 Dashboard Club Recouvrement", "🧑‍💼 Dashboard Commercial", "🚨 2 Rejets Successifs"])
 
 # ===== TAB 1: Club Recouvrement =====
@@ -110,36 +154,30 @@ with tabs[0]:
                  .applymap(color_kpi)
     )
 
-    # Pie chart (Camembert)
-    st.markdown("### 🥧 Camembert Recouvert / À recouvrir (quantité)")
     values = [nb_recouvert, nb_a_recouvrir]
+    values_montant = [montant_recouvert, montant_a_recouvrir]
     labels = ["Recouvert", "À Recouvrir"]
     colors = ["#37c759", "#ff0000"]
-    fig1, ax1 = plt.subplots(figsize=(5, 5))
-    ax1.pie(values, labels=labels, autopct='%1.1f%%', colors=colors, startangle=90, textprops={'fontsize': 14})
-    ax1.axis('equal')
-    st.pyplot(fig1)
+    g_qte, g_montant = chart_outputs([
+        chart(plot_pie, values, labels, colors),
+        chart(plot_pie, values_montant, labels, colors, total=total_montant),
+    ], backend)
+
+    # Pie chart (Camembert)
+    st.markdown("### 🥧 Camembert Recouvert / À recouvrir (quantité)")
+    show_chart(g_qte)
 
     # Pie chart Montant
     st.markdown("### 🥧 Camembert Recouvert / À recouvrir (valeur)")
-    values_montant = [montant_recouvert, montant_a_recouvrir]
-    labels_montant = ["Recouvert", "À Recouvrir"]
-    fig2, ax2 = plt.subplots(figsize=(5, 5))
-    ax2.pie(values_montant, labels=labels_montant, autopct=lambda p: fmt_mad(p * total_montant / 100), colors=colors, startangle=90, textprops={'fontsize': 14})
-    ax2.axis('equal')
-    st.pyplot(fig2)
+    show_chart(g_montant)
 
     # Export Excel
     kpi_tab_export = kpi_tab.copy()
     kpi_tab_export["Total recouvré"] = kpi_tab_export["Total recouvré"].apply(fmt_mad)
     kpi_tab_export["Reste à recouvrir"] = kpi_tab_export["Reste à recouvrir"].apply(fmt_mad)
     kpi_tab_export["Taux de recouvrement (%)"] = kpi_tab_export["Taux de recouvrement (%)"].apply(lambda x: f"{x:.1f} %")
-    excel_data = to_excel({"KPIs Club": kpi_tab_export})
-    st.download_button(
-        label="📥 Télécharger Dashboard Club (Excel)",
-        data=base64.b64decode(excel_data),
-        file_name="recouvrement_club.xlsx"
-    )
+    publish("Recouvrement", {"KPIs Club": kpi_tab_export})
+    export_buttons("📥 Télécharger Dashboard Club (Excel)", {"KPIs Club": kpi_tab_export}, "recouvrement_club.xlsx")
 
 # ===== TAB 2: Dashboard Commercial =====
 with tabs[1]:
@@ -155,14 +193,7 @@ with tabs[1]:
 
     total_montant = df2[montant_col].sum()
 
-    com_tab = df2.groupby(commercial_col).agg(
-        Nb_Incidents = (montant_col, 'count'),
-        Nb_Recouverts = ("Recouvert", 'sum'),
-        Nb_a_Recouvrir = (montant_col, lambda x: x.isna().sum()),
-        Montant_Total = (montant_col, 'sum'),
-        Montant_Recouvert = (montant_col, lambda x: df2.loc[x.index][df2.loc[x.index,"Recouvert"]][montant_col].sum()),
-        Montant_a_Recouvrir = (montant_col, lambda x: df2.loc[x.index][~df2.loc[x.index,"Recouvert"]][montant_col].sum()),
-    )
+    com_tab = commercial_table(df2, commercial_col, montant_col)
     com_tab["Taux (%)"] = 100 * com_tab["Montant_Recouvert"] / com_tab["Montant_Total"].replace(0, np.nan)
     com_tab["Part du total (%)"] = 100 * com_tab["Montant_Recouvert"] / montant_recouvert if montant_recouvert > 0 else 0
     com_tab = com_tab.fillna(0)
@@ -185,70 +216,26 @@ with tabs[1]:
             .applymap(color_taux)
     )
 
+    labels = com_tab.index.astype(str).tolist()
+    incidents = com_tab["Nb_Incidents"].values
+    recouverts = com_tab["Nb_Recouverts"].values
+    g_taux, g_part, g_rejets = chart_outputs([
+        chart(plot_taux, com_tab["Taux (%)"]),
+        chart(plot_part, com_tab["Montant_Recouvert"], com_tab["Part du total (%)"]),
+        chart(plot_rejets, labels, incidents, recouverts),
+    ], backend)
+
     # Barplot taux par commercial
     st.markdown("### 📊 Barplot du taux de recouvrement par commercial")
-    plt.figure(figsize=(9,4))
-    com_tab["Taux (%)"].plot(kind="bar", color=[("#ff0000" if v<50 else "#ff8800" if v<60 else "#37c759") for v in com_tab["Taux (%)"]])
-    plt.title("Taux de recouvrement par commercial")
-    plt.xlabel("Commercial")
-    plt.ylabel("Taux de recouvrement (%)")
-    plt.ylim(0, 100)
-    plt.tight_layout()
-    st.pyplot(plt.gcf())
-    plt.clf()
+    show_chart(g_taux)
 
     # Nouveau barplot : Part de chaque commercial dans le recouvrement global (MAD et %)
     st.markdown("### 📊 Part du montant recouvert par commercial / Total Recouvrement (MAD)")
-    plt.figure(figsize=(10,5))
-    bars = plt.bar(com_tab.index, com_tab["Montant_Recouvert"], color="#2d8ee3")
-    plt.title("Part du montant recouvert par commercial")
-    plt.xlabel("Commercial")
-    plt.ylabel("Montant recouvert (MAD)")
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    for bar, value, part in zip(bars, com_tab["Montant_Recouvert"], com_tab["Part du total (%)"]):
-        plt.text(bar.get_x() + bar.get_width()/2, bar.get_height(), f"{fmt_mad(value)}\n({part:.1f}%)", ha='center', va='bottom', fontsize=10)
-    st.pyplot(plt.gcf())
-    plt.clf()
+    show_chart(g_part)
 
     # Barplot nombre de rejets et recouverts par commercial
     st.markdown("### 📊 Barplot Nombre de rejets / rejets recouverts par commercial")
-    labels = com_tab.index.astype(str).tolist()
-    incidents = com_tab["Nb_Incidents"].values
-    recouverts = com_tab["Nb_Recouverts"].values
-
-    x = np.arange(len(labels))
-    width = 0.35
-
-    fig, ax = plt.subplots(figsize=(10,5))
-    rects1 = ax.bar(x - width/2, incidents, width, label='Nb rejets', color='#e74c3c')
-    rects2 = ax.bar(x + width/2, recouverts, width, label='Nb recouverts', color='#27ae60')
-
-    ax.set_ylabel('Quantité')
-    ax.set_xlabel('Commercial')
-    ax.set_title('Nombre de rejets & rejets recouverts par commercial')
-    ax.set_xticks(x)
-    ax.set_xticklabels(labels, rotation=45)
-    ax.legend()
-
-    for rect in rects1:
-        height = rect.get_height()
-        ax.annotate(f'{int(height)}',
-                    xy=(rect.get_x() + rect.get_width() / 2, height),
-                    xytext=(0, 3),
-                    textcoords="offset points",
-                    ha='center', va='bottom', fontsize=9)
-    for rect in rects2:
-        height = rect.get_height()
-        ax.annotate(f'{int(height)}',
-                    xy=(rect.get_x() + rect.get_width() / 2, height),
-                    xytext=(0, 3),
-                    textcoords="offset points",
-                    ha='center', va='bottom', fontsize=9)
-
-    plt.tight_layout()
-    st.pyplot(fig)
-    plt.clf()
+    show_chart(g_rejets)
 
     # Export Excel
     com_tab_export = com_tab.copy()
@@ -257,45 +244,72 @@ with tabs[1]:
     com_tab_export["Montant_a_Recouvrir"] = com_tab_export["Montant_a_Recouvrir"].apply(fmt_mad)
     com_tab_export["Taux (%)"] = com_tab_export["Taux (%)"].apply(lambda x: f"{x:.1f} %")
     com_tab_export["Part du total (%)"] = com_tab_export["Part du total (%)"].apply(lambda x: f"{x:.1f} %")
-    excel_data = to_excel({"KPIs Commerciaux": com_tab_export})
-    st.download_button(
-        label="📥 Télécharger Dashboard Commerciaux (Excel)",
-        data=base64.b64decode(excel_data),
-        file_name="recouvrement_commerciaux.xlsx"
-    )
+    publish("Recouvrement", {"KPIs Commerciaux": com_tab_export})
+    export_buttons("📥 Télécharger Dashboard Commerciaux (Excel)", {"KPIs Commerciaux": com_tab_export}, "recouvrement_commerciaux.xlsx")
 
-# ===== TAB 3: 2 Rejets Successifs (identique à version précédente) =====
+# ===== TAB 3: Rejets Successifs (index multi-mois) =====
 with tabs[2]:
-    st.subheader("🚨 Détection clients à 2 rejets successifs")
-    st.markdown("Importer **deux fichiers exports mensuels consécutifs**. Les clients avec incidents impayés sur les deux mois seront listés.")
-    file_a = st.file_uploader("Fichier Mois 1", type=["csv", "xlsx"], key="rej1")
-    file_b = st.file_uploader("Fichier Mois 2", type=["csv", "xlsx"], key="rej2")
-
-    if file_a and file_b:
-        ext_a = file_a.name.split('.')[-1]
-        ext_b = file_b.name.split('.')[-1]
-        df_a = safe_read_csv(file_a) if ext_a == "csv" else pd.read_excel(file_a, engine="openpyxl")
-        df_b = safe_read_csv(file_b) if ext_b == "csv" else pd.read_excel(file_b, engine="openpyxl")
-        df_a.columns = df_a.columns.str.strip()
-        df_b.columns = df_b.columns.str.strip()
-        nom_col = match_col(df_a.columns, ["Nom", "Nom du client"])
-        prenom_col = match_col(df_a.columns, ["Prénom", "Prenom"])
-        reglement_col = match_col(df_a.columns, ["Règlement de l'incident", "Reglement", "R"])
-        etat_col = match_col(df_a.columns, ["Etat de l'incident", "Etat", "P"])
-        id_col = "___ClientID"
-        df_a[id_col] = df_a[nom_col].astype(str).str.strip().str.upper() + " " + df_a[prenom_col].astype(str).str.strip().str.upper()
-        df_b[id_col] = df_b[nom_col].astype(str).str.strip().str.upper() + " " + df_b[prenom_col].astype(str).str.strip().str.upper()
-        impayes_a = df_a[(df_a[reglement_col].isna()) | (df_a[etat_col].astype(str).str.upper().str.strip() == "OUVERT")]
-        impayes_b = df_b[(df_b[reglement_col].isna()) | (df_b[etat_col].astype(str).str.upper().str.strip() == "OUVERT")]
-        deux_rejets = pd.merge(
-            impayes_a[[id_col, nom_col, prenom_col]].drop_duplicates(),
-            impayes_b[[id_col, nom_col, prenom_col]].drop_duplicates(),
-            on=id_col, suffixes=('_mois1','_mois2')
-        )
-        deux_rejets["Nom complet"] = deux_rejets[nom_col + "_mois2"].astype(str).str.strip() + " " + deux_rejets[prenom_col + "_mois2"].astype(str).str.strip()
-        st.markdown(f"**Nombre de clients avec 2 rejets successifs** : {len(deux_rejets)}")
-        st.dataframe(deux_rejets[["Nom complet"]])
-        output = BytesIO()
-        deux_rejets[["Nom complet"]].to_excel(output, index=False)
-        output.seek(0)
-        st.download_button("📥 Télécharger liste clients à 2 rejets (Excel)", data=output.getvalue(), file_name="2_rejets_successifs.xlsx")
+    st.subheader("🚨 Détection clients à rejets successifs")
+    st.markdown("Importer **un ou plusieurs exports mensuels** (un fichier par mois). Chaque mois est ajouté à l'index des rejets conservé entre les sessions ; les clients impayés sur N mois consécutifs sont listés.")
+    owner = st.session_state.get("user")
+    # Hors de st.session_state : libéré si la session reste inactive, relu depuis le disque ensuite
+    index = session_object("rejets_index", lambda: load_index(owner))
+
+    # Clé renouvelée à la réinitialisation : vide l'import, sinon les fichiers seraient réappliqués
+    files_mois = st.file_uploader("Exports mensuels", type=["csv", "xlsx"], accept_multiple_files=True,
+                                  key=f"rej_mois_{st.session_state.get('rej_mois_reset', 0)}")
+    impayes_mois = {}  # mois -> {clé client: nom}, fusionné sur tous les fichiers du même mois
+    for f in files_mois or []:
+        df_m = read_upload_or_stop(f)
+        nom_col = match_col(df_m.columns, ["Nom", "Nom du client"])
+        prenom_col = match_col(df_m.columns, ["Prénom", "Prenom"])
+        reglement_col = match_col(df_m.columns, ["Règlement de l'incident", "Reglement", "R"])
+        etat_col = match_col(df_m.columns, ["Etat de l'incident", "Etat", "P"])
+        date_col = match_col(df_m.columns, ["Date de l'incident", "Date du rejet", "Date de rejet", "Date"])
+        if not (nom_col and prenom_col and reglement_col and etat_col):
+            st.warning(f"{f.name} : colonnes Nom / Prénom / Règlement / Etat introuvables, fichier ignoré.")
+            continue
+        mois = parse_dates(df_m[date_col]).dt.to_period("M").mode() if date_col else pd.Series(dtype=object)
+        if mois.empty:
+            # Pas de date exploitable (comme les anciens exports) : le mois est choisi par l'utilisateur
+            courant = pd.Timestamp.today().to_period("M")
+            choix = st.selectbox(
+                f"{f.name} : mois de l'export (aucune date reconnue)",
+                [courant - i for i in range(36)], index=None, placeholder="Choisir le mois...",
+                key=f"rej_mois_choix_{getattr(f, 'file_id', f.name)}",
+            )
+            if choix is None:
+                st.info(f"{f.name} : en attente du mois pour être ajouté à l'index.")
+                continue
+            mois = pd.Series([choix])
+        impayes = df_m[(df_m[reglement_col].isna()) | (df_m[etat_col].astype(str).str.upper().str.strip() == "OUVERT")]
+        nom = impayes[nom_col].astype(str).str.strip()
+        prenom = impayes[prenom_col].astype(str).str.strip()
+        impayes_mois.setdefault(mois.iloc[0], {}).update(zip(nom.str.upper() + " " + prenom.str.upper(), nom + " " + prenom))
+        st.caption(f"{f.name} → {mois.iloc[0]} ({len(impayes)} incidents impayés)")
+    changed = False
+    for mois, clients in impayes_mois.items():
+        changed |= index.apply_month(mois, list(clients), list(clients.values()))
+    if changed:
+        save_index(index, owner)
+
+    mois_dispo = index.applied_months()
+    if mois_dispo:
+        st.caption("Mois indexés : " + ", ".join(str(m) for m in mois_dispo))
+        col1, col2 = st.columns(2)
+        mois_ref = col1.selectbox("Mois de référence", mois_dispo[::-1])
+        nb_min = col2.number_input("Nombre de rejets successifs (minimum)", min_value=2, max_value=max(2, len(mois_dispo)), value=2)
+        series = index.streaks(mois_ref, nb_min)
+        st.markdown(f"**Nombre de clients avec {nb_min} rejets successifs ou plus** : {len(series)}")
+        st.dataframe(series)
+        publish("Recouvrement", {"Rejets successifs": series})
+        export_buttons(f"📥 Télécharger liste clients à {nb_min} rejets (Excel)", {"Sheet1": series},
+                       f"{nb_min}_rejets_successifs.xlsx", index=False)
+        if st.button("🗑️ Réinitialiser l'index des rejets"):
+            index = RejectionIndex()
+            save_index(index, owner)
+            replace_session_object("rejets_index", index)
+            st.session_state["rej_mois_reset"] = st.session_state.get("rej_mois_reset", 0) + 1
+            st.rerun()
+    else:
+        st.info("Aucun mois indexé pour l'instant.")
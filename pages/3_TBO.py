@@ -1,14 +1,18 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-from io import BytesIO
-import base64
+from utils.charts import CHART_BACKEND, chart, chart_output, client_side, colormap, rotate_xticks, show_chart, subplots, vega_bar, vega_pie
+from utils.exports import export_buttons
+from utils.registry import publish
+from utils.ingestion import file_bytes, fingerprint
+from utils.tbo import load_classifier, read_tbo_rows
+from utils.sessions import track_session
 
 # Protection login
 if "logged" not in st.session_state or not st.session_state["logged"]:
     st.warning("Vous devez vous connecter depuis la page d'accueil.")
     st.stop()
 
+track_session("TBO")
 st.title("🏆 ANALYSEUR TBO - Fitness Park")
 
 # Gold branding & style onglets
@@ -33,63 +37,49 @@ st.markdown(f"""
     </style>
 """, unsafe_allow_html=True)
 
-def to_excel(df_dict):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        for sheet, df in df_dict.items():
-            df.to_excel(writer, sheet_name=sheet, index=False)
-    output.seek(0)
-    return base64.b64encode(output.read()).decode()
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_tbo_rows(key, _data):
+    # `key` = empreinte du fichier : le contenu lui-même n'est pas haché par Streamlit
+    return read_tbo_rows(_data)
+
+# Tracés purs : rendus une fois puis servis depuis le cache tant que les données ne changent pas
+@client_side(lambda labels, sizes: vega_pie(sizes, labels))
+def plot_pie_groupes(labels, sizes):
+    fig, ax = subplots(figsize=(7, 5))
+    colors = colormap("tab20c").colors
+    ax.pie(sizes, labels=labels, autopct='%1.1f%%', colors=colors, startangle=90, textprops={'fontsize': 13})
+    ax.axis('equal')
+    return fig
+
+def vega_detail(df_detail, group_sel):
+    valeurs = df_detail.set_index("Produit")["Valeur (DH)"]
+    return vega_bar(valeurs, f"Ventes du groupe {group_sel}", "Produit", "Valeur (DH)", color="#FFD700")
+
+@client_side(vega_detail)
+def plot_detail(df_detail, group_sel):
+    fig, ax = subplots(figsize=(8, 4))
+    ax.bar(df_detail["Produit"], df_detail["Valeur (DH)"], color="#FFD700")
+    ax.set_ylabel("Valeur (DH)")
+    ax.set_xlabel("Produit")
+    ax.set_title(f"Ventes du groupe {group_sel}")
+    rotate_xticks(ax, fontsize=10)
+    fig.tight_layout()
+    for idx, row in df_detail.iterrows():
+        ax.text(idx, row["Valeur (DH)"], f"{row['Valeur (DH)']:,.0f}", ha='center', va='bottom', fontsize=9)
+    return fig
 
 def analyze_tbo(file):
-    product_groups = {
-        "ABONNEMENTS": [
-            "CDD", "CDD1", "CDD12", "CDIAENG", "CDISENG",
-            "SEANCEESSAI", "seancedessaie", "VIP", "OffreSummerBody25",
-            "ULTIMATEEMPLOYE", "HOMEPARK", "1MOFFERT", "EMPLOYE", "REGISTRATION-FEE"
-        ],
-        "ACCESS+": [
-            "ALLACCESS+", "ALLACCESS+BF", "ALLACCESS+YS-cc"
-        ],
-        "COACHING": [
-            "10PT", "15PT", "10PTPREMIUM", "1PT",
-            "DUO15PT", "20PT", "DUO10PT", "SMALLGROUP", "15PTPREMIUM"
-        ],
-        "GOODIES": [
-            "CADENAS", "CEINTUREMUSCU", "cordeasauterfpk",
-            "gantmusculation", "GOURDEFP", "SAC",
-            "SERVIETTEGRISE", "SERVIETTENOIRE", "SHAKER",
-            "sanglecheville"
-        ],
-        "WATERSTATION": [
-            "waterstation"
-        ],
-        "BOUTIQUE": []
-    }
+    # Règles de regroupement : tbo_groups.json (compilées une fois, résultat mis en cache par code produit)
     try:
-        xls = pd.ExcelFile(file)
-        turnover_sheet = None
-        for sheet in xls.sheet_names:
-            sheet_lower = sheet.lower()
-            if "chiffre" in sheet_lower or "affaires" in sheet_lower or "ca" in sheet_lower or "ventes" in sheet_lower:
-                turnover_sheet = sheet
-                break
-        if not turnover_sheet:
-            turnover_sheet = xls.sheet_names[-1]
-        df = pd.read_excel(file, sheet_name=turnover_sheet)
-
-        # Trouver la ligne produits/valeurs
-        product_row, value_row = None, None
-        for idx, row in df.iterrows():
-            row_vals = [str(v) for v in row.values]
-            if any("Fitness Park" in val or "Casablanca" in val for val in row_vals):
-                value_row = idx
-                product_row = idx - 1 if idx > 0 else 0
-                break
-        if product_row is None or value_row is None:
+        classifier = load_classifier()
+    except Exception as e:
+        return None, None, None, None, f"Règles de regroupement illisibles (tbo_groups.json) : {e}", None
+    try:
+        # Lecture unique du classeur, arrêtée à la ligne des valeurs
+        data = file_bytes(file)
+        turnover_sheet, products, values = load_tbo_rows(fingerprint(data), data)
+        if products is None or values is None:
             return None, None, None, None, "Impossible de trouver les lignes de données dans le fichier Excel.", None
-        products = df.iloc[product_row, 3:]
-        values = df.iloc[value_row, 3:]
         turnover_data = {}
         for product, value in zip(products, values):
             if pd.notna(product) and pd.notna(value):
@@ -101,26 +91,13 @@ def analyze_tbo(file):
             del turnover_data["Total"]
 
         # Catégorisation et totaux
-        group_totals = {g:0 for g in product_groups}
-        group_details = {g:{} for g in product_groups}
+        group_totals = {g:0 for g in classifier.groups}
+        group_details = {g:{} for g in classifier.groups}
         all_data = []
         for product, value in turnover_data.items():
-            group = None
             if "Total" in product:
                 continue
-            for g, prod_list in product_groups.items():
-                if g == "ABONNEMENTS":
-                    if any(product.startswith(prefix) for prefix in ["CDD", "CDI", "SEANCE"]):
-                        group = g
-                        break
-                    if any(prod.lower() in product.lower() for prod in prod_list):
-                        group = g
-                        break
-                if product in prod_list:
-                    group = g
-                    break
-            if not group:
-                group = "BOUTIQUE"
+            group = classifier.classify(product)
             group_totals[group] += value
             group_details[group][product] = value
             all_data.append({"Groupe": group, "Produit": product, "Valeur": value})
@@ -139,6 +116,8 @@ if error:
     st.error(error)
     st.stop()
 
+# Rendu des graphiques : choix global de la session (page d'accueil)
+backend = st.session_state.get("chart_backend", CHART_BACKEND)
 tabs = st.tabs(["Résumé Global", "Détails par Groupe", "Export"])
 
 # ===== TAB 1 : Résumé Global =====
@@ -162,13 +141,9 @@ with tabs[0]:
 
     # Pie chart
     st.markdown("### 🥧 Répartition du CA par groupe")
-    fig, ax = plt.subplots(figsize=(7, 5))
     labels = [g for g, t in group_totals.items() if t > 0]
     sizes = [t for g, t in group_totals.items() if t > 0]
-    colors = plt.get_cmap("tab20c").colors
-    ax.pie(sizes, labels=labels, autopct='%1.1f%%', colors=colors, startangle=90, textprops={'fontsize': 13})
-    ax.axis('equal')
-    st.pyplot(fig)
+    show_chart(chart_output(chart(plot_pie_groupes, labels, sizes), backend))
 
 # ===== TAB 2 : Détail par Groupe =====
 with tabs[1]:
@@ -184,25 +159,12 @@ with tabs[1]:
 
     # Nouveau : Barplot par produit du groupe sélectionné
     st.markdown("### 📊 Barplot - Répartition des ventes par produit")
-    plt.figure(figsize=(8, 4))
-    plt.bar(df_detail["Produit"], df_detail["Valeur (DH)"], color="#FFD700")
-    plt.ylabel("Valeur (DH)")
-    plt.xlabel("Produit")
-    plt.title(f"Ventes du groupe {group_sel}")
-    plt.xticks(rotation=45, ha="right", fontsize=10)
-    plt.tight_layout()
-    for idx, row in df_detail.iterrows():
-        plt.text(idx, row["Valeur (DH)"], f"{row['Valeur (DH)']:,.0f}", ha='center', va='bottom', fontsize=9)
-    st.pyplot(plt.gcf())
-    plt.clf()
+    show_chart(chart_output(chart(plot_detail, df_detail, group_sel), backend))
 
 # ===== TAB 3 : Export =====
 with tabs[2]:
     st.subheader("⬇️ Exporter toutes les données")
     df_all = pd.DataFrame(all_data)
-    excel_data = to_excel({"Résumé Groupes": df_totaux, "Détail": df_all})
-    st.download_button(
-        label="📥 Télécharger toutes les données (Excel)",
-        data=base64.b64decode(excel_data),
-        file_name="TBO_analyse.xlsx"
-    )
+    export_dict = {"Résumé Groupes": df_totaux, "Détail": df_all}
+    publish("TBO", export_dict)
+    export_buttons("📥 Télécharger toutes les données (Excel)", export_dict, "TBO_analyse.xlsx", index=False)
@@ -1,14 +1,19 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from io import BytesIO
-import base64
+from utils.charts import backend_toggle, chart, chart_output, chart_outputs, client_side, rotate_xticks, show_chart, subplots, vega_bar, vega_pie
+from utils.dates import parse_dates
+from utils.exports import export_buttons
+from utils.registry import publish
+from utils.ingestion import read_upload_or_stop
+from utils.money import parse_amounts
+from utils.sessions import track_session
 
 if "logged" not in st.session_state or not st.session_state["logged"]:
     st.warning("Vous devez vous connecter depuis la page d'accueil.")
     st.stop()
 
+track_session("VAD")
 st.title("💎 ANALYSEUR VAD - Fitness Park")
 
 VAD_GOLD = "#FFD700"
@@ -32,36 +37,13 @@ st.markdown(f"""
     </style>
 """, unsafe_allow_html=True)
 
-def to_excel(df_dict):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        for sheet, df in df_dict.items():
-            df.to_excel(writer, sheet_name=sheet, index=False)
-    output.seek(0)
-    return base64.b64encode(output.read()).decode()
-
-def safe_read_any(file):
-    name = file.name.lower()
-    if name.endswith(".csv"):
-        for enc in ["utf-8", "cp1252", "latin-1"]:
-            try:
-                file.seek(0)
-                return pd.read_csv(file, encoding=enc, sep=None, engine='python')
-            except Exception:
-                continue
-    else:
-        return pd.read_excel(file, engine="openpyxl")
-    st.error("Impossible de lire le fichier. Essayez un autre format ou encoding.")
-    st.stop()
-
 # --- Upload ---
 vad_file = st.file_uploader("Importer un fichier VAD (Excel ou CSV)", type=["xlsx", "xls", "csv"])
 if not vad_file:
     st.info("Importez un fichier VAD pour démarrer l'analyse.")
     st.stop()
 
-df = safe_read_any(vad_file)
-df.columns = df.columns.str.strip()
+df = read_upload_or_stop(vad_file, "Impossible de lire le fichier. Essayez un autre format ou encoding.")
 
 # --- Auto-match de colonnes (avec fallback pour user selection) ---
 def auto_select(candidates, dfcols, contains_any=None):
@@ -111,21 +93,9 @@ with st.expander("🛠️ Vérifiez/sélectionnez les colonnes à utiliser", exp
 df = df[df[col_auteur].astype(str).str.lower() != "automatisme"]
 df = df[df[col_etat].astype(str).str.lower() != "annulé"]
 
-# Conversion ultra-robuste des montants
-def clean_money(s):
-    return (
-        s.astype(str)
-        .str.replace("\u202f", "", regex=True)
-        .str.replace(" ", "", regex=True)
-        .str.replace(",", ".", regex=False)
-        .str.replace("MAD", "", regex=False)
-        .str.replace("dh", "", regex=False)
-        .str.replace("-", "", regex=False)
-        .str.extract(r'([-+]?\d*\.?\d+)', expand=False)
-    )
-
-df[col_mtht] = pd.to_numeric(clean_money(df[col_mtht]), errors="coerce")
-df[col_mttc] = pd.to_numeric(clean_money(df[col_mttc]), errors="coerce")
+# Conversion ultra-robuste des montants (signe ignoré, comme les avoirs saisis avec "-")
+df[col_mtht] = parse_amounts(df[col_mtht], extract=True).abs()
+df[col_mttc] = parse_amounts(df[col_mttc], extract=True).abs()
 
 df = df[df[col_mtht].notnull() & df[col_mttc].notnull()]
 
@@ -135,7 +105,7 @@ df = df[df[col_mtht] > 0]
 
 # Client unique par Nom+Prénom
 df['Client_Unique'] = (df[col_nom].astype(str).str.strip() + " " + df[col_prenom].astype(str).str.strip()).str.upper()
-df['Date'] = pd.to_datetime(df[col_date], dayfirst=True, errors='coerce')
+df['Date'] = parse_dates(df[col_date])
 
 # ---- Filtres auteur ----
 all_auteurs = sorted(df[col_auteur].dropna().unique().tolist())
@@ -152,6 +122,7 @@ if filtre_700:
     df = df[df[col_mttc] != 700]
 
 # Onglets BI
+backend = backend_toggle("vad")
 tabs = st.tabs([
     "Résumé Global",
     "Par Club (Access+, Waterstation)",
@@ -159,6 +130,51 @@ tabs = st.tabs([
     "Export"
 ])
 
+# ==== Graphiques (tracés purs, servis depuis le cache si les données n'ont pas changé) ====
+@client_side(lambda top_prod: vega_pie(top_prod.values, top_prod.index))
+def plot_pie_produits(top_prod):
+    fig, ax = subplots(figsize=(6, 4))
+    ax.pie(top_prod.values, labels=top_prod.index, autopct='%1.1f%%', startangle=90)
+    ax.axis('equal')
+    return fig
+
+@client_side(lambda ht_by_prod: vega_bar(ht_by_prod, "Montant HT par produit", None, "Montant HT (MAD)", color=VAD_GOLD))
+def plot_ht(ht_by_prod):
+    fig, ax = subplots(figsize=(8,4))
+    ax.bar(ht_by_prod.index, ht_by_prod.values, color=VAD_GOLD)
+    ax.set_ylabel("Montant HT (MAD)")
+    rotate_xticks(ax)
+    fig.tight_layout()
+    return fig
+
+def vega_comparatif(clubs, a, w):
+    data = pd.DataFrame({"Access+": a, "Waterstation": w}, index=clubs)
+    return vega_bar(data, "Comparatif Access+ / Waterstation par club", None, "Clients uniques")
+
+@client_side(vega_comparatif)
+def plot_comparatif(clubs, a, w):
+    bar_width = 0.35
+    idx = np.arange(len(clubs))
+    fig, ax = subplots(figsize=(max(7,len(clubs)*0.6), 4))
+    ax.bar(idx - bar_width/2, a, bar_width, label="Access+", color="#5B7DFF")
+    ax.bar(idx + bar_width/2, w, bar_width, label="Waterstation", color="#60C878")
+    ax.set_xticks(idx)
+    ax.set_xticklabels(clubs, rotation=45, ha="right")
+    ax.set_ylabel("Clients uniques")
+    ax.set_title("Comparatif Access+ / Waterstation par club")
+    ax.legend()
+    fig.tight_layout()
+    return fig
+
+@client_side(lambda serie, color, ylabel, title, figsize=None: vega_bar(serie, title, None, ylabel, color=color))
+def plot_par_commercial(serie, color, ylabel, title, figsize=None):
+    fig, ax = subplots(figsize=figsize)
+    serie.plot(kind="bar", color=color, ax=ax)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    fig.tight_layout()
+    return fig
+
 # ==== Résumé Global ====
 with tabs[0]:
     st.subheader("📊 Résumé Global VAD")
@@ -168,21 +184,13 @@ with tabs[0]:
     st.write("Montant HT total :", f"{df[col_mtht].sum():,.0f} MAD")
     st.write("Nombre de lignes Access+ :", (df[col_produit].astype(str).str.upper() == "ALLACCESS+").sum())
     st.write("Nombre de lignes Waterstation :", (df[col_produit].astype(str).str.lower() == "waterstation").sum())
-    st.markdown("### Pie Chart - Répartition des produits (TT)")
     top_prod = df.groupby(col_produit)[col_mttc].sum().sort_values(ascending=False).head(8)
-    fig, ax = plt.subplots(figsize=(6, 4))
-    ax.pie(top_prod.values, labels=top_prod.index, autopct='%1.1f%%', startangle=90)
-    ax.axis('equal')
-    st.pyplot(fig)
-    st.markdown("### Barplot - Montant HT par produit (Top 10)")
     ht_by_prod = df.groupby(col_produit)[col_mtht].sum().sort_values(ascending=False).head(10)
-    plt.figure(figsize=(8,4))
-    plt.bar(ht_by_prod.index, ht_by_prod.values, color=VAD_GOLD)
-    plt.ylabel("Montant HT (MAD)")
-    plt.xticks(rotation=45, ha="right")
-    plt.tight_layout()
-    st.pyplot(plt.gcf())
-    plt.clf()
+    g_pie, g_ht = chart_outputs([chart(plot_pie_produits, top_prod), chart(plot_ht, ht_by_prod)], backend)
+    st.markdown("### Pie Chart - Répartition des produits (TT)")
+    show_chart(g_pie)
+    st.markdown("### Barplot - Montant HT par produit (Top 10)")
+    show_chart(g_ht)
 
 # ==== Par Club (Access+, Waterstation) ====
 with tabs[1]:
@@ -203,22 +211,10 @@ with tabs[1]:
     access_counts = acc_club
     water_counts = water_club
     clubs = sorted(list(set(access_counts.index) | set(water_counts.index)))
-    bar_width = 0.35
-    idx = np.arange(len(clubs))
     a = [access_counts.get(club, 0) for club in clubs]
     w = [water_counts.get(club, 0) for club in clubs]
     if any(a) or any(w):
-        fig, ax = plt.subplots(figsize=(max(7,len(clubs)*0.6), 4))
-        ax.bar(idx - bar_width/2, a, bar_width, label="Access+", color="#5B7DFF")
-        ax.bar(idx + bar_width/2, w, bar_width, label="Waterstation", color="#60C878")
-        ax.set_xticks(idx)
-        ax.set_xticklabels(clubs, rotation=45, ha="right")
-        ax.set_ylabel("Clients uniques")
-        ax.set_title("Comparatif Access+ / Waterstation par club")
-        ax.legend()
-        plt.tight_layout()
-        st.pyplot(fig)
-        plt.clf()
+        show_chart(chart_output(chart(plot_comparatif, clubs, a, w), backend))
     else:
         st.info("Aucun résultat pour Access+ ou Waterstation sur cette sélection.")
 
@@ -232,13 +228,7 @@ with tabs[2]:
     vad_com = commercial_df.groupby(commercial_col)['Client_Unique'].nunique().sort_values(ascending=False)
     st.dataframe(vad_com.to_frame("Clients uniques"))
     if not vad_com.empty:
-        fig, ax = plt.subplots()
-        vad_com.plot(kind="bar", color="#FFD700", ax=ax)
-        plt.ylabel("Clients uniques")
-        plt.title("VAD - Clients uniques par commercial")
-        plt.tight_layout()
-        st.pyplot(fig)
-        plt.clf()
+        show_chart(chart_output(chart(plot_par_commercial, vad_com, "#FFD700", "Clients uniques", "VAD - Clients uniques par commercial"), backend))
     else:
         st.info("Aucun résultat commercial sur cette sélection.")
 
@@ -260,42 +250,30 @@ with tabs[2]:
     # === BARPLOT ACCESS+ PAR COMMERCIAL ===
     st.markdown("### Barplot Access+ par commercial")
     if not access_detail.empty:
-        fig, ax = plt.subplots(figsize=(max(7,len(access_detail)*0.6), 4))
-        access_detail.plot(kind="bar", color="#FFD700", ax=ax)
-        ax.set_ylabel("Clients Access+ uniques")
-        ax.set_title("Access+ par commercial")
-        plt.tight_layout()
-        st.pyplot(fig)
-        plt.clf()
+        show_chart(chart_output(chart(plot_par_commercial, access_detail, "#FFD700", "Clients Access+ uniques", "Access+ par commercial",
+                                      figsize=(max(7,len(access_detail)*0.6), 4)), backend))
     else:
         st.info("Aucun commercial n'a vendu Access+ sur cette sélection.")
 
     # === BARPLOT WATERSTATION PAR COMMERCIAL ===
     st.markdown("### Barplot Waterstation par commercial")
     if not water_detail.empty:
-        fig, ax = plt.subplots(figsize=(max(7,len(water_detail)*0.6), 4))
-        water_detail.plot(kind="bar", color="#60C878", ax=ax)
-        ax.set_ylabel("Clients Waterstation uniques")
-        ax.set_title("Waterstation par commercial")
-        plt.tight_layout()
-        st.pyplot(fig)
-        plt.clf()
+        show_chart(chart_output(chart(plot_par_commercial, water_detail, "#60C878", "Clients Waterstation uniques", "Waterstation par commercial",
+                                      figsize=(max(7,len(water_detail)*0.6), 4)), backend))
     else:
         st.info("Aucun commercial n'a vendu Waterstation sur cette sélection.")
 
 # ==== Export ====
 with tabs[3]:
     st.subheader("⬇️ Exporter les analyses")
-    excel_data = to_excel({
+    # Fichiers (dont toutes les lignes VAD) construits seulement au clic
+    sheets = {
         "VAD_Global": df,
         "Access+_par_club": acc_club.to_frame("Clients Access+ uniques"),
         "Waterstation_par_club": water_club.to_frame("Clients Waterstation uniques"),
         "Par_Commercial": vad_com.to_frame("Clients uniques"),
         "Access+_par_commercial": access_detail.to_frame(),
         "Waterstation_par_commercial": water_detail.to_frame()
-    })
-    st.download_button(
-        label="📥 Télécharger toutes les données (Excel)",
-        data=base64.b64decode(excel_data),
-        file_name="VAD_analyse.xlsx"
-    )
+    }
+    publish("VAD", sheets)
+    export_buttons("📥 Télécharger toutes les données (Excel)", sheets, "VAD_analyse.xlsx", index=False)
@@ -1,36 +1,73 @@
+import re
 import streamlit as st
 import pandas as pd
-import base64
-from io import BytesIO
+from utils.exports import FORMATS, XLSX_MIME, export_bytes, export_file_name, export_mime
+from utils.registry import assemble, current_session, published, results
+from utils.sessions import track_session
 
+track_session("Export Global")
 st.title("📦 Export Global Analyses")
 
-def to_excel(df_dict):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        for name, df in df_dict.items():
-            if df is not None and not df.empty:
-                df.to_excel(writer, sheet_name=name[:28], index=False)
-    output.seek(0)
-    return base64.b64encode(output.read()).decode()
+FILE_NAME = "Export_Analyses_FitnessPark.xlsx"
 
-export_dict = {}
-if "abos_df" in st.session_state and st.session_state["abos_df"] is not None:
-    export_dict["Abonnements"] = st.session_state["abos_df"]
-if "recouvrement_df" in st.session_state and st.session_state["recouvrement_df"] is not None:
-    export_dict["Recouvrement"] = st.session_state["recouvrement_df"]
-if "vad_df" in st.session_state and st.session_state["vad_df"] is not None:
-    export_dict["VAD"] = st.session_state["vad_df"]
-if "facture_df" in st.session_state and st.session_state["facture_df"] is not None:
-    export_dict["Facture"] = st.session_state["facture_df"]
+def sheet_names(names):
+    # "page/tableau" -> nom de feuille Excel unique (31 caractères max, sans []:*?/\)
+    sheets, taken = {}, set()
+    for name in names:
+        base = re.sub(r"[\[\]:*?/\\]", "-", name.replace("/", " - "))[:31]
+        sheet, i = base, 2
+        while sheet.lower() in taken:
+            suffix = f"~{i}"
+            sheet, i = base[:31 - len(suffix)] + suffix, i + 1
+        taken.add(sheet.lower())
+        sheets[name] = sheet
+    return sheets
 
-if export_dict:
-    excel_data = to_excel(export_dict)
-    st.success(f"{len(export_dict)} analyses prêtes à exporter.")
-    st.download_button(
-        label="📥 Télécharger toutes les analyses (Excel)",
-        data=base64.b64decode(excel_data),
-        file_name="Export_Analyses_FitnessPark.xlsx"
-    )
+def flat_tables(tables):
+    # Index significatifs (tableaux croisés) gardés en colonnes : export sans index pour toutes les feuilles
+    names = sheet_names(tables)
+    frames = {}
+    for name, df in tables.items():
+        if isinstance(df, pd.Series):
+            df = df.to_frame()
+        frames[names[name]] = df if isinstance(df.index, pd.RangeIndex) else df.reset_index()
+    return frames
+
+def build_workbook(tables):
+    return export_bytes(flat_tables(tables), "xlsx", index=False)
+
+@st.fragment(run_every=1)
+def attente_classeur(job):
+    if job.done():
+        st.rerun()
+    st.info("⏳ Classeur global en cours d'assemblage…")
+
+names = published()
+if names:
+    st.success(f"{len(names)} analyses prêtes à exporter.")
+    st.caption(" • ".join(names))
+    session = current_session()
+    # Classeur assemblé en arrière-plan depuis le registre (refait si une page republie)
+    job = assemble("xlsx", build_workbook)
+    if not job.done():
+        attente_classeur(job)
+    elif job.exception() is not None:
+        st.error(f"Erreur pendant l'assemblage du classeur : {job.exception()}")
+    else:
+        st.download_button(
+            label="📥 Télécharger toutes les analyses (Excel)",
+            data=job.result,
+            file_name=FILE_NAME,
+            mime=XLSX_MIME
+        )
+    # Formats rapides : écrits au clic depuis le registre
+    others = [fmt for fmt in FORMATS if fmt != "xlsx"]
+    for col, fmt in zip(st.columns(len(others)), others):
+        col.download_button(
+            f"⬇️ {FORMATS[fmt].label}",
+            data=lambda fmt=fmt: export_bytes(flat_tables(results(session=session)), fmt, index=False),
+            file_name=export_file_name(FILE_NAME, fmt, names),
+            mime=export_mime(fmt, names),
+        )
 else:
     st.warning("Aucune analyse n'a encore été importée sur les autres pages.")
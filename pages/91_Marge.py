@@ -2,7 +2,11 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import os
+from utils.exports import export_buttons
+from utils.registry import publish
+from utils.sessions import track_session
 
+track_session("Marge")
 st.title("🛍️ Marge Goodies & Boutique (analyse avancée)")
 
 # Charger goodies.csv et boutique.csv du dossier principal
@@ -87,19 +91,9 @@ if file_tbo1 and file_tbo6:
     st.markdown("### 💰 Marge totale Goodies & Boutique")
     st.write(f"**Marge totale globale** : {df_marge['MargeTotale'].sum():,.0f} MAD")
 
-    # Export Excel
-    import base64
-    from io import BytesIO
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df_marge.to_excel(writer, sheet_name="Marge_Produits", index=False)
-    output.seek(0)
-    b64 = base64.b64encode(output.read()).decode()
-    st.download_button(
-        "📥 Exporter l'analyse (Excel)",
-        base64.b64decode(b64),
-        file_name="marge_goodies_boutique.xlsx"
-    )
+    # Export Excel et formats de ré-import (construits au clic)
+    publish("Marge", {"Marge_Produits": df_marge})
+    export_buttons("📥 Exporter l'analyse (Excel)", {"Marge_Produits": df_marge}, "marge_goodies_boutique.xlsx", index=False)
 else:
     st.info("Merci d'importer la page 1 ET la page 6 du TBO.")
 
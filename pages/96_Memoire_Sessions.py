@@ -0,0 +1,53 @@
+import streamlit as st
+import pandas as pd
+from utils.exports import process_rss
+from utils.registry import registry_stats
+from utils.sessions import compact_idle_sessions, is_admin, memory_report, monitor_stats, track_session
+
+# ========== PROTECTION LOGIN ==========
+if "logged" not in st.session_state or not st.session_state["logged"]:
+    st.warning("Vous devez vous connecter depuis la page d'accueil.")
+    st.stop()
+if not is_admin(st.session_state.get("user")):
+    st.warning("Page réservée aux administrateurs.")
+    st.stop()
+
+track_session("Mémoire des sessions")
+st.title("🧠 Mémoire des sessions")
+
+MO = 1024 * 1024
+
+stats, registry = monitor_stats(), registry_stats()
+c1, c2, c3, c4 = st.columns(4)
+c1.metric("Mémoire du processus", f"{process_rss() / MO:.0f} Mo")
+c2.metric("Sessions suivies", stats["sessions"])
+c3.metric("Résultats en mémoire", f"{registry['bytes'] / MO:.0f} Mo", f"{registry['spilled']} sur disque", delta_color="off")
+c4.metric("Compactages", stats["compactions"], f"{stats['freed_bytes'] / MO:.0f} Mo libérés", delta_color="off")
+
+if st.button(f"🧹 Compacter les sessions inactives (> {stats['idle_minutes']:g} min)"):
+    n = compact_idle_sessions()
+    st.success(f"{n} session(s) compactée(s).")
+
+rows = memory_report()
+if rows:
+    df = pd.DataFrame(rows)
+    tableau = pd.DataFrame({
+        "Utilisateur": df["user"],
+        "Dernière page": df["page"],
+        "Inactive (min)": (df["idle_s"] / 60).round(1),
+        "Compactée": df["compacted"],
+        "Imports (Mo)": df["uploads"] / MO,
+        "Session (Mo)": df["session_state"] / MO,
+        "Objets (Mo)": df["objects"] / MO,
+        "Résultats (Mo)": df["results"] / MO,
+        "Résultats sur disque": df["results_on_disk"],
+        "Classeurs (Mo)": df["assembled"] / MO,
+        "Total (Mo)": df["total"] / MO,
+    })
+    st.dataframe(tableau.round(2), width="stretch", hide_index=True)
+    st.caption(
+        "Imports : fichiers tenus par Streamlit jusqu'à leur retrait du formulaire. "
+        "Une session compactée garde ses imports ; ses résultats sont relus sur disque et ses classeurs refaits à la demande."
+    )
+else:
+    st.info("Aucune session suivie pour le moment.")
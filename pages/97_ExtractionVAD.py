@@ -1,51 +1,42 @@
 import streamlit as st
 import pandas as pd
-import datetime
-import io
+import time
+from utils.dates import compute_age, parse_dates
+from utils.dialect import read_csv_bytes, sniff
+from utils.exports import export_buttons
+from utils.registry import publish
+from utils.ingestion import file_bytes
+from utils.sessions import track_session
 
 st.set_page_config(layout="wide")
+track_session("Extraction VAD")
 st.title("🔍 Extraction clients CDI (Abonnement) : Access+, Waterstation, <25 ans")
 
 def read_csv_any_encoding_any_sep(file):
-    encodings = ["utf-8", "utf-16", "ISO-8859-1", "latin1"]
-    seps = [",", ";", "\t", "|"]
+    # Détection encodage/séparateur sur un préfixe borné, puis une seule lecture complète
+    data = file_bytes(file)
+    t0 = time.perf_counter()
+    dialect = sniff(data)
+    detection_ms = (time.perf_counter() - t0) * 1000
     last_error = None
-    for enc in encodings:
-        for sep in seps:
-            try:
-                file.seek(0)
-                df = pd.read_csv(file, encoding=enc, sep=sep)
-                if len(df.columns) > 1:
-                    return df
-            except Exception as e:
-                last_error = e
-                continue
-    file.seek(0)
-    preview = file.read(1024)
-    st.error("Impossible de lire le fichier CSV (testé tous les encodages et séparateurs).")
+    if dialect is not None:
+        try:
+            df = read_csv_bytes(data, dialect)
+            if len(df.columns) > 1:
+                st.caption(
+                    f"Format détecté : encodage **{dialect.encoding}**, séparateur **{dialect.sep!r}** "
+                    f"(détection en {detection_ms:.1f} ms)"
+                )
+                return df
+        except Exception as e:
+            last_error = e
+    preview = data[:1024]
+    st.error("Impossible de lire le fichier CSV (encodage ou séparateur non détecté).")
     st.write("Aperçu brut du fichier :", preview)
     if last_error:
         st.write(f"Dernière erreur rencontrée : {last_error}")
     raise ValueError("Lecture du fichier impossible.")
 
-def calcul_age(date_naissance):
-    try:
-        if pd.isnull(date_naissance): return None
-        if isinstance(date_naissance, str):
-            for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%Y/%m/%d"):
-                try:
-                    date = datetime.datetime.strptime(date_naissance, fmt)
-                    break
-                except: continue
-            else:
-                return None
-        else:
-            date = pd.to_datetime(date_naissance, errors='coerce')
-        today = pd.Timestamp("today")
-        age = (today - pd.to_datetime(date)).days // 365
-        return age
-    except: return None
-
 uploaded_file = st.file_uploader("Importer la liste des clients", type=["csv", "xlsx"])
 
 if uploaded_file is not None:
@@ -83,7 +74,7 @@ if uploaded_file is not None:
 
     # Calcul de l'âge pour vue 3 (sur df_abos_cdi)
     try:
-        df_abos_cdi["AGE"] = df_abos_cdi[col_naissance].apply(calcul_age)
+        df_abos_cdi["AGE"] = compute_age(parse_dates(df_abos_cdi[col_naissance]))
     except Exception as e:
         st.warning(f"Erreur lors du calcul de l'âge : {e}")
         df_abos_cdi["AGE"] = None
@@ -130,18 +121,14 @@ if uploaded_file is not None:
         vue_csv = pd.DataFrame()
         csv_name = "extraction_clients.csv"
 
-    # Export Excel combiné (noms de feuilles < 31 chars !)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        vue1.to_excel(writer, sheet_name="CDI_Abos_SansAcc+", index=False)
-        vue2.to_excel(writer, sheet_name="CDI_Abos_SansAcc+_niWater", index=False)
-        vue3.to_excel(writer, sheet_name="CDI_Abos_SansAcc+_niWtr_<25", index=False)
-
-    st.download_button(
-        "⬇️ Télécharger l'export Excel combiné",
-        data=output.getvalue(),
-        file_name="clients_CDI_abonnement_sans_options.xlsx"
-    )
+    # Export Excel combiné (noms de feuilles < 31 chars !) et formats de ré-import, construits au clic
+    vues = {
+        "CDI_Abos_SansAcc+": vue1,
+        "CDI_Abos_SansAcc+_niWater": vue2,
+        "CDI_Abos_SansAcc+_niWtr_<25": vue3,
+    }
+    publish("Extraction", vues)
+    export_buttons("⬇️ Télécharger l'export Excel combiné", vues, "clients_CDI_abonnement_sans_options.xlsx", index=False)
 
     # Export CSV vue sélectionnée
     st.markdown("---")
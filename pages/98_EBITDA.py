@@ -1,11 +1,15 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import io
 import re
 import calendar
 from collections import Counter
 import numpy as np
+from utils.charts import backend_toggle, chart, chart_outputs, client_side, rotate_xticks, show_chart, subplots, vega_bar
+from utils.columnar_cache import read_excel_cached
+from utils.dialect import SNIFF_BYTES, Dialect, detect_encoding, head_lines, read_csv_bytes
+from utils.ingestion import file_bytes
+from utils.money import parse_amounts
+from utils.sessions import track_session
 
 # ----- MAPPING -----
 mapping = {
@@ -69,14 +73,24 @@ mapping = {
 SEGMENTS_ORDER = list(mapping.keys())
 mapping = {str(k).strip(): [str(x).strip() for x in v] for k, v in mapping.items()}
 
+# Index inversé intitulé normalisé -> segment (premier segment du mapping prioritaire)
+SEGMENT_INDEX = {}
+for seg, lignes in mapping.items():
+    for x in lignes:
+        SEGMENT_INDEX.setdefault(x.strip().upper(), seg)
+SEGMENT_INDEX.setdefault("INTERETS DES EMPRUNTS ET DETTES", "INTERETS / FINANCE")
+
 def get_segment(nom):
-    for seg, lignes in mapping.items():
-        if isinstance(nom, str) and nom.strip().upper() in [x.strip().upper() for x in lignes]:
-            return seg
-    if isinstance(nom, str) and nom.strip().upper() == "INTERETS DES EMPRUNTS ET DETTES":
-        return "INTERETS / FINANCE"
+    if isinstance(nom, str):
+        return SEGMENT_INDEX.get(nom.strip().upper())
     return None
 
+def assign_segments(intitules):
+    # Une seule résolution par intitulé distinct, puis report sur toutes les lignes
+    codes, uniques = pd.factorize(intitules)
+    segs = np.array([get_segment(u) for u in uniques] + [None], dtype=object)
+    return pd.Series(segs[codes], index=intitules.index)
+
 def make_unique(seq):
     counter = Counter()
     res = []
@@ -106,7 +120,26 @@ def extract_month_name(header):
         return f"{calendar.month_name[month]} {year}"
     return header
 
+def vega_segment(seg, months, bar_vals):
+    return vega_bar(pd.Series(bar_vals, index=months), f"Variation de {seg}", "Mois", "Montant (MAD)", color="#4682b4")
+
+@client_side(vega_segment)
+def plot_segment(seg, months, bar_vals):
+    # Tracé pur : rendu une fois par (segment, période, valeurs) puis servi depuis le cache
+    fig, ax = subplots(figsize=(min(8, 1 + 0.5*len(months)), 4))
+    ax.bar(months, bar_vals, color="#4682b4")
+    ax.set_ylabel("Montant (MAD)")
+    ax.set_xlabel("Mois")
+    ax.set_title(f"Variation de {seg}")
+    for i, v in enumerate(bar_vals):
+        if not pd.isna(v) and v != 0:
+            ax.text(i, v, f"{int(v):,}", ha='center', va='bottom', fontsize=10)
+    rotate_xticks(ax)
+    fig.tight_layout()
+    return fig
+
 st.set_page_config(layout="wide")
+track_session("EBITDA")
 st.title("💼 Analyse des Charges & Segments")
 
 uploaded_file = st.file_uploader("🗂️ Importer le fichier Balance", type=["csv", "xlsx"])
@@ -114,15 +147,11 @@ uploaded_file = st.file_uploader("🗂️ Importer le fichier Balance", type=["c
 if uploaded_file is not None:
     try:
         if uploaded_file.name.endswith('.csv'):
-            content = uploaded_file.read()
-            encodings = ['utf-8', 'ISO-8859-1', 'latin1']
-            for enc in encodings:
-                try:
-                    s = content.decode(enc)
-                    break
-                except:
-                    continue
-            lines = s.splitlines()
+            # En-têtes (lignes 4 et 5) lus sur un préfixe borné ; le corps est parsé
+            # directement depuis les octets importés, sans copie texte intermédiaire
+            content = file_bytes(uploaded_file)
+            enc = detect_encoding(content[:SNIFF_BYTES], ['utf-8', 'ISO-8859-1'])
+            lines = head_lines(content, 5, enc)
             sep_candidates = [';', ',', '\t', '|']
             sep = max(sep_candidates, key=lambda c: lines[3].count(c))
             header4 = lines[3].split(sep)
@@ -130,23 +159,19 @@ if uploaded_file is not None:
             header4 = make_unique(header4)
             header5 = lines[4].split(sep)
             header5 = [str(x).strip() for x in header5]
-            data_lines = lines[5:]
-            s_data = "\n".join(data_lines)
-            file_buffer = io.StringIO(s_data)
-            df = pd.read_csv(file_buffer, sep=sep, header=None)
+            df = read_csv_bytes(content, Dialect(enc, sep), header=None, skiprows=5)
             df.columns = header4
         else:
-            xls = pd.ExcelFile(uploaded_file)
-            header4 = pd.read_excel(xls, header=None, nrows=4).iloc[3].astype(str).str.strip().tolist()
+            # Une seule lecture du classeur (cache Parquet), en-têtes pris sur les lignes 4 et 5
+            raw = read_excel_cached(file_bytes(uploaded_file), header=None)
+            header4 = raw.iloc[3].astype(str).str.strip().tolist()
             header4 = make_unique(header4)
-            header5 = pd.read_excel(xls, header=None, nrows=5).iloc[4].astype(str).str.strip().tolist()
-            df = pd.read_excel(xls, header=None, skiprows=5)
+            header5 = raw.iloc[4].astype(str).str.strip().tolist()
+            df = raw.iloc[5:].reset_index(drop=True)
             df.columns = header4
 
         # -- SEGMENTS DETECTION --
-        mapping_vals = set()
-        for lignes in mapping.values():
-            mapping_vals.update([x.strip().upper() for x in lignes])
+        mapping_vals = set(SEGMENT_INDEX)
         detected_intitule_col = None
         for col in df.columns:
             sample = df[col].astype(str).str.strip().str.upper()
@@ -170,17 +195,10 @@ if uploaded_file is not None:
 
         # -- FORMAT MONTANTS ULTIME --
         for col in mois_cols:
-            df[col] = (
-                df[col]
-                .astype(str)
-                .str.replace(r"[\s\u202f\t\r\n]", "", regex=True)
-                .str.replace(",", ".", regex=False)
-                .replace({"None": np.nan, "nan": np.nan, "": np.nan})
-            )
-            df[col] = pd.to_numeric(df[col], errors='coerce')
+            df[col] = parse_amounts(df[col])
 
         # -- AFFECTATION DES SEGMENTS --
-        df["SEGMENT"] = df[detected_intitule_col].apply(get_segment)
+        df["SEGMENT"] = assign_segments(df[detected_intitule_col])
         df["SEGMENT"] = pd.Categorical(df["SEGMENT"], categories=SEGMENTS_ORDER, ordered=True)
         df = df[df["SEGMENT"].notnull()]
 
@@ -251,20 +269,12 @@ if uploaded_file is not None:
         )
 
         if segments_selected and selected_months:
-            for seg in segments_selected:
+            # Un graphique par segment, rendus en parallèle (ou specs Vega-Lite)
+            backend = backend_toggle("ebitda")
+            graphs = chart_outputs([chart(plot_segment, seg, selected_months, agg_annee.loc[seg, selected_months].values) for seg in segments_selected], backend)
+            for seg, graph in zip(segments_selected, graphs):
                 st.markdown(f"#### 📊 Segment : **{seg}** ({from_month} → {to_month})")
-                bar_vals = agg_annee.loc[seg, selected_months].values
-                fig, ax = plt.subplots(figsize=(min(8, 1 + 0.5*len(selected_months)), 4))
-                ax.bar(selected_months, bar_vals, color="#4682b4")
-                ax.set_ylabel("Montant (MAD)")
-                ax.set_xlabel("Mois")
-                ax.set_title(f"Variation de {seg}")
-                for i, v in enumerate(bar_vals):
-                    if not pd.isna(v) and v != 0:
-                        ax.text(i, v, f"{int(v):,}", ha='center', va='bottom', fontsize=10)
-                plt.xticks(rotation=45, ha="right")
-                plt.tight_layout()
-                st.pyplot(fig)
+                show_chart(graph)
         else:
             st.info("Sélectionne au moins un segment ET une période pour voir les graphiques !")
 
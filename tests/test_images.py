@@ -0,0 +1,175 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from PIL import Image
+
+from utils.images import CircuitBreaker, DuckDuckGoFetcher, ImageStore, SearchBlocked, ThumbnailPrefetcher
+
+
+def jpeg_bytes():
+    buf = BytesIO()
+    Image.new("RGB", (600, 400), "gold").save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+class MockSearch(BaseHTTPRequestHandler):
+    """Faux service de recherche : latence, pannes, absence de jeton et produits sans image injectables."""
+
+    latency = 0.0
+    fail = False          # HTTP 500 sur la recherche
+    block = False         # page sans jeton vqd (limitation de débit)
+    no_results = set()    # produits sans image
+    image = jpeg_bytes()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="text/html"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client parti sur timeout : attendu dans les tests de délai
+
+    def do_POST(self):
+        time.sleep(self.latency)
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.fail:
+            return self._send(500, b"erreur")
+        body = b"<html>pas de jeton</html>" if self.block else b"<script>vqd=4-1234&</script>"
+        self._send(200, body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/i.js":
+            product = parse_qs(url.query)["q"][0]
+            results = [] if product in self.no_results else [{"image": f"http://{self.headers['Host']}/img/{product}.jpg"}]
+            return self._send(200, json.dumps({"results": results}).encode(), "application/json")
+        self._send(200, self.image, "image/jpeg")
+
+
+@pytest.fixture
+def server():
+    handler = type("Handler", (MockSearch,), {"no_results": set()})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield handler, f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_after_consecutive_failures_then_half_opens():
+    clock = Clock()
+    breaker = CircuitBreaker(max_failures=3, cooldown=60, clock=clock)
+    for _ in range(2):
+        breaker.failure()
+    assert breaker.allow() and not breaker.is_open
+    breaker.failure()
+    assert breaker.is_open and not breaker.allow()
+    clock.now = 61
+    assert breaker.allow()        # demi-ouvert : un seul essai
+    assert not breaker.allow()
+    breaker.failure()             # essai raté : reste ouvert
+    assert breaker.is_open
+    clock.now = 130
+    assert breaker.allow()
+    breaker.success()             # essai réussi : refermé
+    assert not breaker.is_open and breaker.allow()
+
+
+def test_fetches_and_stores_thumbnails(server, tmp_path):
+    _, url = server
+    store = ImageStore(str(tmp_path))
+    prefetcher = ThumbnailPrefetcher(store, DuckDuckGoFetcher(url, timeout=2))
+    prefetcher.request(["GOURDE", "SHAKER"])
+    assert prefetcher.wait(10) == 0
+    with Image.open(store.get("GOURDE")) as img:
+        assert max(img.size) <= 300
+
+
+def test_products_without_image_are_negatively_cached(server, tmp_path):
+    handler, url = server
+    handler.no_results.add("INCONNU")
+    store = ImageStore(str(tmp_path))
+    prefetcher = ThumbnailPrefetcher(store, DuckDuckGoFetcher(url, timeout=2))
+    prefetcher.request(["INCONNU"])
+    prefetcher.wait(10)
+    assert store.get("INCONNU") is None and store.is_missing("INCONNU")
+    assert prefetcher.request(["INCONNU"]) == 0   # pas de nouvelle recherche
+    assert not store.is_missing("INCONNU", ttl=0)  # expire après le délai
+    assert prefetcher.breaker.failures == 0
+
+
+def test_missing_vqd_token_counts_as_breaker_failure(server, tmp_path):
+    handler, url = server
+    handler.block = True
+    fetcher = DuckDuckGoFetcher(url, timeout=2)
+    with pytest.raises(SearchBlocked):
+        fetcher.image_url("GOURDE")
+    store = ImageStore(str(tmp_path))
+    prefetcher = ThumbnailPrefetcher(store, fetcher, max_workers=1, breaker=CircuitBreaker(max_failures=2, cooldown=60))
+    prefetcher.request(["A", "B"])
+    prefetcher.wait(10)
+    assert prefetcher.breaker.is_open
+    assert not store.is_missing("A")   # pas marqué « sans image » pour 7 jours
+    assert prefetcher.request(["C"]) == 0
+
+
+def test_server_errors_open_the_breaker(server, tmp_path):
+    handler, url = server
+    handler.fail = True
+    prefetcher = ThumbnailPrefetcher(ImageStore(str(tmp_path)), DuckDuckGoFetcher(url, timeout=2), max_workers=1,
+                                     breaker=CircuitBreaker(max_failures=3, cooldown=60))
+    prefetcher.request(["A", "B", "C", "D"])
+    prefetcher.wait(10)
+    assert prefetcher.breaker.is_open
+    assert not any(prefetcher.store.get(p) for p in "ABCD")
+
+
+def test_unreadable_thumbnail_only_marks_that_product(server, tmp_path):
+    handler, url = server
+    handler.image = b"pas une image"
+    store = ImageStore(str(tmp_path))
+    prefetcher = ThumbnailPrefetcher(store, DuckDuckGoFetcher(url, timeout=2), breaker=CircuitBreaker(max_failures=1))
+    prefetcher.request(["A", "B"])
+    prefetcher.wait(10)
+    assert store.is_missing("A") and store.is_missing("B")
+    assert not prefetcher.breaker.is_open
+
+
+def test_wait_returns_at_the_deadline_with_slow_service(server, tmp_path):
+    handler, url = server
+    handler.latency = 1.0
+    prefetcher = ThumbnailPrefetcher(ImageStore(str(tmp_path)), DuckDuckGoFetcher(url, timeout=5))
+    prefetcher.request(["LENT"])
+    start = time.monotonic()
+    assert prefetcher.wait(0.2) == 1
+    assert time.monotonic() - start < 0.8
+    assert prefetcher.wait(10) == 0
+
+
+def test_timeouts_count_as_failures(server, tmp_path):
+    handler, url = server
+    handler.latency = 1.0
+    prefetcher = ThumbnailPrefetcher(ImageStore(str(tmp_path)), DuckDuckGoFetcher(url, timeout=(0.5, 0.2)),
+                                     max_workers=1, breaker=CircuitBreaker(max_failures=1, cooldown=60))
+    prefetcher.request(["A"])
+    prefetcher.wait(10)
+    assert prefetcher.breaker.is_open and not prefetcher.store.is_missing("A")
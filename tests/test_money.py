@@ -0,0 +1,80 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.money import parse_amounts
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("650", 650.0),
+    ("700 MAD", 700.0),
+    ("12,5", 12.5),
+    ("1 234,50 MAD", 1234.5),
+    ("1\u202f234,50 dh", 1234.5),  # espace fine insécable
+    ("1\u00a0234 DHS", 1234.0),    # espace insécable
+    ("1 234,50 Dh", 1234.5),
+    ("-45,00 dh", -45.0),
+])
+def test_french_and_moroccan_formats(text, expected):
+    assert parse_amounts([text])[0] == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1.234,50", 1234.5),
+    ("1,234.50", 1234.5),
+    ("1.234.567,89", 1234567.89),
+    ("2,000,000.5", 2000000.5),
+])
+def test_thousands_separators(text, expected):
+    assert parse_amounts([text])[0] == expected
+
+
+def test_unreadable_values_are_nan_unless_extracting():
+    values = ["Total: 650 dh", "abc", None, ""]
+    assert parse_amounts(values).isna().all()
+    assert parse_amounts(values, extract=True).tolist()[0] == 650.0
+    assert parse_amounts(values, extract=True)[1:].isna().all()
+
+
+def test_keeps_index_and_name_and_maps_repeated_values():
+    s = pd.Series(["650 MAD", "700", "650 MAD", None], index=[10, 20, 30, 40], name="Montant")
+    out = parse_amounts(s)
+    assert out.name == "Montant" and out.index.tolist() == [10, 20, 30, 40]
+    assert out.tolist()[:3] == [650.0, 700.0, 650.0] and np.isnan(out[40])
+
+
+def test_numeric_columns_are_returned_as_float():
+    out = parse_amounts(pd.Series([1, 2, 3]))
+    assert out.dtype == "float64" and out.tolist() == [1.0, 2.0, 3.0]
+
+
+def former_clean_money(s):
+    # Ancienne conversion de la page VAD (référence du benchmark)
+    return pd.to_numeric(
+        s.astype(str)
+        .str.replace("\u202f", "", regex=True)
+        .str.replace(" ", "", regex=True)
+        .str.replace(",", ".", regex=False)
+        .str.replace("MAD", "", regex=False)
+        .str.replace("dh", "", regex=False)
+        .str.replace("-", "", regex=False)
+        .str.extract(r'([-+]?\d*\.?\d+)', expand=False),
+        errors="coerce",
+    )
+
+
+@pytest.mark.skipif(not os.environ.get("VENTESABOS_BENCH"), reason="benchmark : VENTESABOS_BENCH=1 pour l'exécuter")
+@pytest.mark.parametrize("n", [10_000, 100_000, 1_000_000])
+def test_benchmark_against_former_clean_money(n):
+    rng = np.random.default_rng(0)
+    values = pd.Series(rng.choice(["650,00 MAD", "700 MAD", "1\u202f200,50 dh", "120", "80,5 dh", "49,90"], n))
+    t0 = time.perf_counter()
+    former = former_clean_money(values)
+    t1 = time.perf_counter()
+    parsed = parse_amounts(values, extract=True).abs()
+    t2 = time.perf_counter()
+    pd.testing.assert_series_equal(parsed, former, check_names=False)
+    print(f"\n{n:>9,} valeurs : ancien {t1 - t0:.3f} s, parse_amounts {t2 - t1:.3f} s ({(t1 - t0) / (t2 - t1):.0f}x)")
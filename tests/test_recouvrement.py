@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from utils.recouvrement import commercial_table
+
+
+def former_com_tab(df2, commercial_col, montant_col):
+    # Agrégation de la page Recouvrement avant commercial_table (référence)
+    return df2.groupby(commercial_col).agg(
+        Nb_Incidents = (montant_col, 'count'),
+        Nb_Recouverts = ("Recouvert", 'sum'),
+        Nb_a_Recouvrir = (montant_col, lambda x: x.isna().sum()),
+        Montant_Total = (montant_col, 'sum'),
+        Montant_Recouvert = (montant_col, lambda x: df2.loc[x.index][df2.loc[x.index,"Recouvert"]][montant_col].sum()),
+        Montant_a_Recouvrir = (montant_col, lambda x: df2.loc[x.index][~df2.loc[x.index,"Recouvert"]][montant_col].sum()),
+    )
+
+
+def incidents():
+    return pd.DataFrame({
+        "Commercial": ["Ali", "Sara", None, "Ali", "Omar", np.nan, "Sara", "Omar", "Ali"],
+        "Montant": [650.0, 0.0, 700.0, np.nan, 0.0, 120.5, np.nan, 0.0, 1200.5],
+        "Recouvert": [True, False, True, False, True, False, True, False, False],
+    })
+
+
+def test_commercial_table_matches_former_aggregation():
+    df = incidents()
+    expected = former_com_tab(df, "Commercial", "Montant")
+    pd.testing.assert_frame_equal(commercial_table(df, "Commercial", "Montant"), expected)
+
+
+def test_commercial_table_matches_former_aggregation_on_random_incidents():
+    rng = np.random.default_rng(0)
+    n = 5000
+    montant = rng.choice([0.0, 650.0, 700.0, 1200.5, np.nan], n)
+    df = pd.DataFrame({
+        "Commercial": rng.choice(["Ali", "Sara", "Omar", None], n),
+        "Montant": montant,
+        "Recouvert": rng.random(n) < 0.4,
+    }, index=rng.permutation(n))
+    expected = former_com_tab(df, "Commercial", "Montant")
+    pd.testing.assert_frame_equal(commercial_table(df, "Commercial", "Montant"), expected)
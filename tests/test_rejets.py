@@ -0,0 +1,68 @@
+import pandas as pd
+
+from utils import rejets
+from utils.rejets import RejectionIndex, load_index, save_index
+
+
+def apply(index, month, names):
+    return index.apply_month(month, [n.upper() for n in names], names)
+
+
+def streaks(index, month, min_streak=1):
+    return dict(index.streaks(month, min_streak).itertuples(index=False))
+
+
+def test_streaks_grow_month_by_month():
+    index = RejectionIndex()
+    assert apply(index, "2024-01", ["Ali", "Sara"])
+    assert apply(index, "2024-02", ["Ali", "Omar"])
+    assert apply(index, "2024-03", ["Ali", "Sara", "Omar"])
+    assert streaks(index, "2024-03") == {"Ali": 3, "Omar": 2, "Sara": 1}
+    assert streaks(index, "2024-03", min_streak=2) == {"Ali": 3, "Omar": 2}
+    assert index.applied_months() == [pd.Period(m, freq="M") for m in ("2024-01", "2024-02", "2024-03")]
+
+
+def test_reapplying_the_same_month_is_a_no_op():
+    index = RejectionIndex()
+    apply(index, "2024-01", ["Ali"])
+    assert not apply(index, "2024-01", ["Ali"])
+
+
+def test_gap_resets_the_streak():
+    index = RejectionIndex()
+    apply(index, "2024-01", ["Ali"])
+    apply(index, "2024-03", ["Ali"])
+    assert streaks(index, "2024-03") == {"Ali": 1}
+
+
+def test_out_of_order_month_rebuilds_later_streaks():
+    index = RejectionIndex()
+    apply(index, "2024-01", ["Ali", "Sara"])
+    apply(index, "2024-03", ["Ali", "Sara"])
+    assert streaks(index, "2024-03") == {"Ali": 1, "Sara": 1}
+    assert apply(index, "2024-02", ["Ali"])
+    assert streaks(index, "2024-02") == {"Ali": 2}
+    assert streaks(index, "2024-03") == {"Ali": 3, "Sara": 1}
+
+
+def test_replacing_a_past_month_rebuilds_later_streaks():
+    index = RejectionIndex()
+    for month in ("2024-01", "2024-02", "2024-03"):
+        apply(index, month, ["Ali"])
+    apply(index, "2024-02", ["Sara"])
+    assert streaks(index, "2024-03") == {"Ali": 1}
+
+
+def test_json_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(rejets, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(rejets, "CACHE_DIR", str(tmp_path / "cache"))
+    index = RejectionIndex()
+    apply(index, "2024-01", ["Ali", "Sara"])
+    apply(index, "2024-02", ["Ali"])
+    apply(index, "2023-12", ["Sara"])
+    save_index(index, "Bob")
+    loaded = load_index("Bob")
+    assert loaded.applied_months() == index.applied_months()
+    for month in index.applied_months():
+        assert streaks(loaded, month) == streaks(index, month)
+    assert load_index("Alice").applied_months() == []
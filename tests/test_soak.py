@@ -0,0 +1,97 @@
+"""Tests d'endurance : mémoire stable sur des milliers de reruns / sessions.
+
+Longs : lancés seulement avec VENTESABOS_SOAK=<nombre de reruns> (ex. 2000).
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import charts, registry, sessions
+from utils.charts import ChartCache, chart, chart_pngs, rotate_xticks, subplots
+from utils.exports import process_rss
+from utils.registry import ResultRegistry
+from utils.sessions import SessionMonitor
+
+RERUNS = int(os.environ.get("VENTESABOS_SOAK", "0"))
+MB = 1024 * 1024
+
+pytestmark = pytest.mark.skipif(not RERUNS, reason="endurance : VENTESABOS_SOAK=<reruns> pour l'exécuter")
+
+
+def draw_bars(values, title=""):
+    fig, ax = subplots(figsize=(6, 3))
+    ax.bar(values.index, values.values, color="#FFD700")
+    ax.set_title(title)
+    rotate_xticks(ax)
+    return fig
+
+
+def draw_line(values, title=""):
+    fig, ax = subplots(figsize=(6, 3))
+    ax.plot(values.index, values.values, marker="o")
+    ax.set_title(title)
+    return fig
+
+
+def test_chart_rendering_keeps_rss_flat(monkeypatch):
+    # Petit cache : chaque rerun retrace (données différentes), la croissance mesurée est celle des figures
+    monkeypatch.setattr(charts, "_cache", ChartCache(4 * MB))
+    rng = np.random.default_rng(0)
+    labels = [f"Club {i}" for i in range(12)]
+    warmup = max(RERUNS // 10, 20)
+    baseline = None
+    for i in range(RERUNS):
+        data = [pd.Series(rng.integers(0, 500, len(labels)), index=labels) for _ in range(4)]
+        pngs = chart_pngs([
+            chart(draw_bars, data[0], title=f"Ventes {i}"),
+            chart(draw_bars, data[1], title="Recouvrement"),
+            chart(draw_line, data[2], title="Semaines"),
+            chart(draw_line, data[3], title="Commerciaux"),
+        ])
+        assert all(png.startswith(b"\x89PNG") for png in pngs)
+        if i == warmup:
+            baseline = process_rss()
+    growth = (process_rss() - baseline) / MB
+    print(f"\n{RERUNS} reruns x 4 graphiques : RSS +{growth:.1f} Mo après échauffement")
+    assert charts._cache.nbytes <= charts._cache.max_bytes
+    assert growth < 32
+
+
+def test_session_cycling_stays_within_registry_and_monitor_budgets(monkeypatch, tmp_path):
+    reg = ResultRegistry(session_budget=2 * MB, global_budget=8 * MB, directory=str(tmp_path))
+    monkeypatch.setattr(registry, "_registry", reg)
+    clock = [0.0]
+    monitor = SessionMonitor(idle_seconds=600, clock=lambda: clock[0])
+    monkeypatch.setattr(sessions, "SWEEP_INTERVAL_S", 0)
+
+    rng = np.random.default_rng(0)
+    live = set()
+    warmup = max(RERUNS // 10, 20)
+    baseline = None
+    for i in range(RERUNS):
+        clock[0] += 30
+        # 8 sessions ouvertes en même temps ; toutes les 40 interactions une session ferme, une autre arrive
+        session = f"s{(i // 40) + (i % 8)}"
+        live = {f"s{(i // 40) + k}" for k in range(8)}
+        df = pd.DataFrame({"Club": rng.choice(["Racine", "Maarif", "Anfa"], 20_000),
+                           "Montant": rng.random(20_000)})  # ~1,5 Mo
+        reg.publish(session, f"Page/Tableau {i % 3}", df)
+        monitor.touch(session, "Admin", "Soak", 0)
+        monitor.put_object(session, "rejets_index", df[["Montant"]].copy())
+        monitor.sweep(lambda s: s in live)
+
+        assert reg.nbytes <= reg.global_budget
+        assert reg.session_stats(session)["bytes"] <= reg.session_budget
+        assert set(monitor.sessions()) <= live
+        if i == warmup:
+            baseline = process_rss()
+
+    closed = {s for s, _ in reg._entries} - live
+    assert not closed  # résultats des sessions fermées supprimés
+    assert sum(monitor.object_bytes(s) for s in monitor.sessions()) <= len(live) * 2 * MB
+    assert len(os.listdir(tmp_path)) <= len(live)  # dossiers de déchargement des sessions fermées supprimés
+    growth = (process_rss() - baseline) / MB
+    print(f"\n{RERUNS} interactions, sessions renouvelées : registre {reg.nbytes / MB:.1f} Mo, RSS +{growth:.1f} Mo")
+    assert growth < 64
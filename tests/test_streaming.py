@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.dialect import read_csv_bytes, sniff
+from utils.streaming import count_sales, stream_counts
+
+
+def csv_bytes(df):
+    return df.to_csv(index=False, sep=";").encode("utf-8")
+
+
+def in_memory_counts(data):
+    return count_sales(read_csv_bytes(data, sniff(data)), "Offre", "Commercial", "Date")
+
+
+def assert_same_counts(data, chunksize):
+    expected = in_memory_counts(data)
+    streamed = stream_counts(data, "Offre", "Commercial", "Date", chunksize=chunksize)
+    pd.testing.assert_frame_equal(streamed, expected, check_dtype=False)
+
+
+@pytest.mark.parametrize("chunksize", [3, 7, 1000])
+def test_numeric_looking_keys_keep_one_label_across_chunks(chunksize):
+    # "101" est numérique dans certains blocs seulement : une seule clé attendue
+    df = pd.DataFrame({
+        "Offre": ["101"] * 5 + ["CDI"] + ["101"] * 4,
+        "Commercial": ["7"] * 9 + [None],
+        "Date": ["01/02/2024"] * 8 + ["pas une date", "02/02/2024"],
+    })
+    assert_same_counts(csv_bytes(df), chunksize)
+    counts = stream_counts(csv_bytes(df), "Offre", "Commercial", "Date", chunksize=chunksize)
+    assert counts.loc[counts["Offre"] == "101", "n"].sum() == 9
+
+
+def test_random_export_matches_in_memory_counts():
+    rng = np.random.default_rng(0)
+    n = 5000
+    df = pd.DataFrame({
+        "Offre": rng.choice(["CDI", "CDD 12M", "12", "24", None], n),
+        "Commercial": rng.choice(["Ali", "Sara", "3", None], n),
+        "Date": rng.choice(list(pd.date_range("2024-01-01", periods=60).strftime("%d/%m/%Y")) + [""], n),
+    })
+    assert_same_counts(csv_bytes(df), 777)
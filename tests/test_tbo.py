@@ -0,0 +1,40 @@
+import io
+import re
+import zipfile
+
+from openpyxl import Workbook
+
+from utils.tbo import read_tbo_rows
+
+
+def tbo_workbook(dimension=None):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Chiffre d'affaires"
+    ws.append(["Rapport", None, None, None])
+    ws.append(["Club", "Période", "Total", "Abonnement", "Coaching"])
+    ws.append(["Fitness Park Casablanca", "2024-01", 1500, 1000, 500])
+    buf = io.BytesIO()
+    wb.save(buf)
+    if dimension is None:
+        return buf.getvalue()
+    # Réécrit la balise <dimension> comme certains exports tiers (valeur fausse)
+    out = io.BytesIO()
+    with zipfile.ZipFile(buf) as src, zipfile.ZipFile(out, "w") as dst:
+        for item in src.infolist():
+            content = src.read(item.filename)
+            if item.filename.startswith("xl/worksheets/"):
+                content = re.sub(rb'<dimension ref="[^"]*"', b'<dimension ref="%s"' % dimension.encode(), content)
+            dst.writestr(item, content)
+    return out.getvalue()
+
+
+def test_read_tbo_rows():
+    sheet, products, values = read_tbo_rows(tbo_workbook())
+    assert sheet == "Chiffre d'affaires"
+    assert products == ["Abonnement", "Coaching"]
+    assert values == [1000, 500]
+
+
+def test_read_tbo_rows_ignores_wrong_dimension_tag():
+    assert read_tbo_rows(tbo_workbook("A1:A1")) == read_tbo_rows(tbo_workbook())
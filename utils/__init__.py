@@ -0,0 +1 @@
+"""Briques partagées entre les pages de la BI Suite Fitness Park."""
@@ -0,0 +1,274 @@
+"""Cache des graphiques rendus (PNG), indexé par l'empreinte des données.
+
+Chaque graphique est décrit par une fonction de tracé `draw(*data, **style)`
+qui retourne une figure matplotlib. L'empreinte combine le code de la
+fonction, les données tracées et les paramètres de style : tant qu'ils ne
+changent pas, un rerun Streamlit (widget sans rapport, autre onglet...) sert
+les octets PNG déjà rendus au lieu de retracer la figure.
+
+Les figures sont construites avec l'API objet (`Figure` + canevas Agg), sans
+l'état global de pyplot : aucune figure « courante » partagée entre sessions,
+rien à fermer, et des graphiques indépendants peuvent être rendus en
+parallèle par un pool de threads.
+
+Backend "vega" : les graphiques qui ont un équivalent Vega-Lite (voir
+`client_side`) sont envoyés au navigateur sous forme de spec + données et
+rendus côté client (survol, zoom sans rerun) ; les autres restent en PNG.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import matplotlib
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from utils.ingestion import ParseCache, content_key
+
+# Budget mémoire du cache de graphiques (Mo)
+CHART_CACHE_MB = int(os.environ.get("VENTESABOS_CHART_CACHE_MB", "64"))
+# Mêmes réglages que st.pyplot
+DPI = 200
+RENDER_WORKERS = int(os.environ.get("VENTESABOS_RENDER_WORKERS", "4"))
+
+# "matplotlib" (PNG rendu par le serveur) ou "vega" (Vega-Lite rendu par le navigateur)
+CHART_BACKENDS = ("matplotlib", "vega")
+CHART_BACKEND = os.environ.get("VENTESABOS_CHART_BACKEND", "matplotlib")
+
+Chart = namedtuple("Chart", "draw data style")
+
+
+class ChartCache(ParseCache):
+    """Cache LRU borné en octets : empreinte du graphique -> PNG, avec temps de rendu."""
+
+    sizeof = staticmethod(len)
+
+    def __init__(self, max_bytes):
+        super().__init__(max_bytes)
+        self.renders = 0
+        self.render_seconds = 0.0
+        self._render_lock = threading.Lock()
+
+    def record_render(self, seconds):
+        with self._render_lock:
+            self.renders += 1
+            self.render_seconds += seconds
+
+    def stats(self):
+        stats = super().stats()
+        with self._render_lock:
+            stats["renders"] = self.renders
+            stats["render_seconds"] = self.render_seconds
+            stats["avg_render_ms"] = 1000 * self.render_seconds / self.renders if self.renders else 0.0
+        return stats
+
+
+_cache = ChartCache(CHART_CACHE_MB * 1024 * 1024)
+
+
+def chart_stats():
+    return _cache.stats()
+
+
+_PLAIN = (str, bytes, int, float, complex, bool, type(None), tuple, list, dict, set, frozenset)
+
+
+def _code_parts(func, seen):
+    """Bytecode, constantes (libellés, tailles, couleurs...), fonctions imbriquées, globales et
+    variables de fermeture lues par `func`, récursivement pour les fonctions appelées du même code."""
+    code = func.__code__
+    if code in seen:
+        return []
+    seen.add(code)
+    parts = [f"{code.co_filename}:{func.__qualname__}"]
+    stack = [code]
+    while stack:
+        c = stack.pop()
+        parts.append(c.co_code)
+        for const in c.co_consts:
+            if hasattr(const, "co_code"):
+                stack.append(const)
+            else:
+                parts.append(repr(const))
+        for name in c.co_names:
+            if name in func.__globals__:
+                parts.extend(_value_parts(name, func.__globals__[name], seen))
+    cells = func.__closure__ or ()
+    for name, cell in zip(code.co_freevars, cells):
+        try:
+            parts.extend(_value_parts(name, cell.cell_contents, seen))
+        except ValueError:  # cellule pas encore remplie
+            pass
+    return parts
+
+
+def _value_parts(name, value, seen):
+    if hasattr(value, "__code__"):
+        return [name, *_code_parts(value, seen)]
+    if isinstance(value, _PLAIN):
+        return [name, repr(value)]
+    return []  # modules, classes, objets : identifiés par leur nom dans le bytecode
+
+
+def chart_key(draw, data, style):
+    """Empreinte : code de la fonction de tracé (constantes, globales lues) + données + style."""
+    return content_key(_code_parts(draw, set()), data, sorted(style.items()))
+
+
+def subplots(figsize=None):
+    """Figure Agg autonome (hors pyplot) et son unique axe."""
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.subplots()
+
+
+def colormap(name):
+    return matplotlib.colormaps[name]
+
+
+def rotate_xticks(ax, rotation=45, ha="right", **kwargs):
+    for label in ax.get_xticklabels():
+        label.set(rotation=rotation, ha=ha, **kwargs)
+
+
+def render_png(fig):
+    buf = BytesIO()
+    fig.savefig(buf, format="png", dpi=DPI, bbox_inches="tight")
+    return buf.getvalue()
+
+
+def chart_png(draw, *data, **style):
+    """PNG du graphique `draw(*data, **style)`, depuis le cache si déjà rendu."""
+    key = chart_key(draw, data, style)
+    png = _cache.get(key)
+    if png is None:
+        start = time.perf_counter()
+        fig = draw(*data, **style)
+        try:
+            png = render_png(fig)
+        finally:
+            fig.clear()  # libère les artistes sans attendre le ramasse-miettes
+        _cache.record_render(time.perf_counter() - start)
+        _cache.put(key, png)
+    return png
+
+
+def chart(draw, *data, **style):
+    return Chart(draw, data, style)
+
+
+_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="charts")
+
+
+def chart_pngs(charts):
+    """PNG de graphiques indépendants (`chart(...)`), rendus en parallèle, dans l'ordre."""
+    return list(_pool.map(lambda c: chart_png(c.draw, *c.data, **c.style), charts))
+
+
+def client_side(builder):
+    """Décorateur : associe à une fonction de tracé sa spec Vega-Lite (même signature)."""
+    def register(draw):
+        draw.vega = builder
+        return draw
+    return register
+
+
+def chart_outputs(charts, backend=CHART_BACKEND):
+    """Spec Vega-Lite (dict) pour chaque graphique qui en a une si backend="vega", PNG sinon."""
+    outputs = [None] * len(charts)
+    server = []
+    for i, c in enumerate(charts):
+        builder = getattr(c.draw, "vega", None)
+        if backend == "vega" and builder is not None:
+            outputs[i] = builder(*c.data, **c.style)
+        else:
+            server.append(i)
+    for i, png in zip(server, chart_pngs([charts[i] for i in server])):
+        outputs[i] = png
+    return outputs
+
+
+def chart_output(c, backend=CHART_BACKEND):
+    return chart_outputs([c], backend)[0]
+
+
+def backend_toggle(key):
+    """Choix du rendu pour une page ; par défaut, le choix global de la session (page d'accueil)."""
+    import streamlit as st
+    default = st.session_state.get("chart_backend", CHART_BACKEND)
+    interactive = st.toggle("🖱️ Graphiques interactifs (rendu navigateur)", value=default == "vega", key=f"chart_backend_{key}")
+    return "vega" if interactive else "matplotlib"
+
+
+def show_chart(output):
+    import streamlit as st
+    if isinstance(output, dict):
+        st.vega_lite_chart(output, width="stretch")
+    else:
+        st.image(output, width="stretch")
+
+
+# --- Specs Vega-Lite génériques ---
+
+def _records(data, colors=None):
+    """Series / DataFrame large -> lignes {x, serie, valeur}, dans l'ordre de l'index."""
+    frame = data.to_frame() if isinstance(data, pd.Series) else data.copy()
+    temporal = pd.api.types.is_datetime64_any_dtype(frame.index)
+    frame.index = frame.index.astype(str)
+    frame.columns = frame.columns.astype(str)
+    long = frame.rename_axis("x").reset_index().melt("x", var_name="serie", value_name="valeur")
+    long["valeur"] = long["valeur"].astype(object).where(long["valeur"].notna(), None)
+    if colors is not None:
+        long["couleur"] = list(colors) * frame.shape[1]
+    return long.to_dict("records"), temporal, frame.shape[1] > 1
+
+
+def vega_bar(data, title, xlabel, ylabel, color=None, stacked=False, ylim=None, figsize=None):
+    """Barres (groupées ou empilées si plusieurs séries). `color` : une couleur ou une par barre."""
+    per_bar = isinstance(color, (list, tuple))
+    records, _, multi = _records(data, color if per_bar else None)
+    y = {"field": "valeur", "type": "quantitative", "title": ylabel, "stack": "zero" if stacked else None}
+    if ylim is not None:
+        y["scale"] = {"domain": list(ylim)}
+    encoding = {"x": {"field": "x", "type": "nominal", "sort": None, "title": xlabel}, "y": y}
+    mark = {"type": "bar", "tooltip": True}
+    if multi:
+        encoding["color"] = {"field": "serie", "type": "nominal", "title": None}
+        if not stacked:
+            encoding["xOffset"] = {"field": "serie"}
+    elif per_bar:
+        encoding["color"] = {"field": "couleur", "type": "nominal", "scale": None, "legend": None}
+    elif color:
+        mark["color"] = color
+    return {"title": title, "data": {"values": records}, "mark": mark, "encoding": encoding}
+
+
+def vega_line(data, title, xlabel, ylabel, color=None, figsize=None):
+    records, temporal, multi = _records(data)
+    encoding = {
+        "x": {"field": "x", "type": "temporal" if temporal else "ordinal", "title": xlabel},
+        "y": {"field": "valeur", "type": "quantitative", "title": ylabel},
+    }
+    mark = {"type": "line", "point": True, "tooltip": True}
+    if multi:
+        encoding["color"] = {"field": "serie", "type": "nominal", "title": None}
+    elif color:
+        mark["color"] = color
+    return {"title": title, "data": {"values": records}, "mark": mark, "encoding": encoding}
+
+
+def vega_pie(values, labels, colors=None, total=None):
+    """Camembert ; `total` (étiquettes en MAD côté matplotlib) est inutile ici : le survol donne la valeur."""
+    color = {"field": "libelle", "type": "nominal", "title": None}
+    if colors is not None:
+        color["scale"] = {"domain": list(labels), "range": list(colors)[:len(labels)]}
+    return {
+        "data": {"values": [{"libelle": str(l), "valeur": float(v)} for l, v in zip(labels, values)]},
+        "mark": {"type": "arc", "tooltip": True},
+        "encoding": {"theta": {"field": "valeur", "type": "quantitative", "stack": True}, "color": color},
+        "view": {"stroke": None},
+    }
@@ -0,0 +1,191 @@
+"""Cache disque Parquet des classeurs Excel importés.
+
+Chaque classeur est converti une seule fois (clé = empreinte du contenu +
+options de lecture) ; les sessions, pages et utilisateurs suivants relisent
+le Parquet en memory-map au lieu de reparser le XML. Le dossier est borné
+par un budget disque, les fichiers les moins récemment utilisés sont
+supprimés en premier. Une lecture depuis le cache rend le même DataFrame
+qu'une lecture directe : libellés de colonnes et types des cellules
+(nombres, dates, texte mélangés dans une colonne) sont conservés.
+"""
+import base64
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from io import BytesIO
+
+import numpy as np
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # cache disque désactivé, lecture Excel directe
+    pa = None
+
+CACHE_DIR = os.environ.get("VENTESABOS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ventesabos_cache"))
+DISK_BUDGET_MB = int(os.environ.get("VENTESABOS_DISK_CACHE_MB", "1024"))
+
+_lock = threading.Lock()
+
+
+def cache_key(data, **read_kwargs):
+    h = hashlib.sha256(data)
+    h.update(repr(sorted(read_kwargs.items())).encode())
+    return h.hexdigest()
+
+
+def _path(key):
+    return os.path.join(CACHE_DIR, f"{key}.parquet")
+
+
+def arrow_safe(df):
+    """Colonnes objet à types mélangés (ex. texte + nombres) converties en texte, NaN conservés."""
+    for col in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df[col] = df[col].map(lambda v: v if isinstance(v, str) or pd.isna(v) else str(v))
+    return df
+
+
+_META = b"ventesabos"
+
+
+def _kind(value):
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, datetime.datetime):
+        return "datetime"
+    if isinstance(value, datetime.time):
+        return "time"
+    return "str"
+
+
+def _to_table(df):
+    """Table Arrow fidèle au DataFrame lu : libellés de colonnes d'origine (entiers, dates...) gardés en
+    métadonnées, colonnes à types mélangés éclatées en une colonne par type (nombres restés nombres)."""
+    arrays, names, mixed = [], [], {}
+    for pos in range(df.shape[1]):
+        col = df.iloc[:, pos]
+        if col.dtype == object:
+            try:
+                arrays.append(pa.array(col, from_pandas=True))
+                names.append(str(pos))
+                continue
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                pass
+            kinds = col.map(lambda v: None if pd.isna(v) else _kind(v))
+            mixed[pos] = sorted(kinds.dropna().unique())
+            for kind in mixed[pos]:
+                values = col.where(kinds == kind, None)
+                if kind == "str":
+                    values = values.map(lambda v: None if v is None else str(v))
+                arrays.append(pa.array(values.tolist()))
+                names.append(f"{pos}:{kind}")
+        else:
+            arrays.append(pa.Array.from_pandas(col))
+            names.append(str(pos))
+    meta = {"columns": base64.b64encode(pickle.dumps(df.columns)).decode("ascii"), "mixed": mixed}
+    return pa.table(arrays, names=names).replace_schema_metadata({_META: json.dumps(meta)})
+
+
+def _from_table(table):
+    meta = json.loads(table.schema.metadata[_META])
+    columns = pickle.loads(base64.b64decode(meta["columns"]))
+    mixed = {int(pos): kinds for pos, kinds in meta["mixed"].items()}
+    plain = table.select([name for name in table.column_names if ":" not in name]).to_pandas()
+    data = {}
+    for pos in range(len(columns)):
+        if pos in mixed:
+            values = np.full(table.num_rows, np.nan, dtype=object)
+            for kind in mixed[pos]:
+                part = table.column(f"{pos}:{kind}").to_pylist()
+                for i, v in enumerate(part):
+                    if v is not None:
+                        values[i] = pd.Timestamp(v) if kind == "datetime" else v
+            data[pos] = values
+        else:
+            data[pos] = plain[str(pos)]
+    df = pd.DataFrame(data)
+    df.columns = columns
+    return df
+
+
+def load(key):
+    path = _path(key)
+    try:
+        table = pq.read_table(path, memory_map=True)
+        if _META not in (table.schema.metadata or {}):
+            return None  # entrée d'un ancien format : relue depuis l'Excel
+    except (OSError, pa.ArrowException):
+        return None
+    os.utime(path)  # marque l'entrée comme récemment utilisée
+    return _from_table(table)
+
+
+def store(key, df):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _path(key)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        pq.write_table(_to_table(df), tmp)
+        os.replace(tmp, path)
+    except (OSError, pa.ArrowException):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return
+    evict()
+
+
+def evict(budget_bytes=None):
+    """Supprime les fichiers les plus anciens (mtime) jusqu'à respecter le budget."""
+    budget = DISK_BUDGET_MB * 1024 * 1024 if budget_bytes is None else budget_bytes
+    with _lock:
+        try:
+            entries = [e for e in os.scandir(CACHE_DIR) if e.name.endswith(".parquet")]
+        except FileNotFoundError:
+            return
+        stats = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in entries))
+        total = sum(size for _, size, _ in stats)
+        for _, size, path in stats:
+            if total <= budget:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def disk_usage():
+    try:
+        entries = [e for e in os.scandir(CACHE_DIR) if e.name.endswith(".parquet")]
+    except FileNotFoundError:
+        return {"files": 0, "bytes": 0, "budget_bytes": DISK_BUDGET_MB * 1024 * 1024}
+    return {
+        "files": len(entries),
+        "bytes": sum(e.stat().st_size for e in entries),
+        "budget_bytes": DISK_BUDGET_MB * 1024 * 1024,
+    }
+
+
+def read_excel_cached(data, **read_kwargs):
+    """pd.read_excel sur des octets, via le cache Parquet si pyarrow est installé."""
+    if pa is None:
+        return pd.read_excel(BytesIO(data), **read_kwargs)
+    key = cache_key(data, **read_kwargs)
+    df = load(key)
+    if df is None:
+        df = pd.read_excel(BytesIO(data), **read_kwargs)
+        store(key, df)
+    return df
@@ -0,0 +1,58 @@
+"""Conversion vectorisée des colonnes de dates et calcul d'âge.
+
+Le format dominant est déterminé sur un échantillon, la colonne est parsée
+en une passe dans ce format ; seules les valeurs restantes passent par les
+formats de secours. Chaque date texte distincte n'est parsée qu'une fois.
+"""
+import numpy as np
+import pandas as pd
+
+# Exports français : jour avant mois
+DATE_FORMATS = [
+    "%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%Y/%m/%d", "%d.%m.%Y",
+    "%d/%m/%Y %H:%M", "%d/%m/%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S",
+]
+SAMPLE_SIZE = 500
+
+
+def _rank_formats(text, formats, sample_size):
+    """Formats qui parsent au moins une valeur de l'échantillon, du plus au moins fréquent."""
+    sample = text.head(sample_size)
+    scores = [(pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum(), -i, fmt) for i, fmt in enumerate(formats)]
+    return [fmt for score, _, fmt in sorted(scores, reverse=True) if score > 0]
+
+
+def parse_dates(values, formats=DATE_FORMATS, dayfirst=True, sample_size=SAMPLE_SIZE):
+    """Series datetime64 (NaT si illisible) à partir d'une colonne de dates."""
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    codes, uniques = pd.factorize(values)
+    uniq = pd.Series(uniques, dtype=object)
+    out = pd.Series(pd.NaT, index=uniq.index, dtype="datetime64[ns]")
+    is_text = uniq.map(lambda v: isinstance(v, str)).astype(bool)
+    if (~is_text).any():  # dates Excel / Timestamp déjà typées
+        out[~is_text] = pd.to_datetime(uniq[~is_text], errors="coerce")
+    text = uniq[is_text].str.strip()
+    remaining = text[text != ""]
+    for fmt in _rank_formats(remaining, formats, sample_size):
+        if remaining.empty:
+            break
+        parsed = pd.to_datetime(remaining, format=fmt, errors="coerce")
+        ok = parsed.notna()
+        out[ok[ok].index] = parsed[ok]
+        remaining = remaining[~ok]
+    if not remaining.empty:
+        # Formats imprévus : inférence élément par élément, sur les seuls restes
+        out[remaining.index] = pd.to_datetime(remaining, format="mixed", dayfirst=dayfirst, errors="coerce")
+    result = np.append(out.to_numpy(), np.datetime64("NaT", "ns"))[codes]
+    return pd.Series(result, index=values.index, name=values.name)
+
+
+def compute_age(birth_dates, today=None):
+    """Âge en années révolues (float, NaN si date inconnue), calcul vectorisé."""
+    birth = pd.Series(birth_dates)
+    today = pd.Timestamp("today") if today is None else pd.Timestamp(today)
+    years = today.year - birth.dt.year
+    before_birthday = (birth.dt.month > today.month) | ((birth.dt.month == today.month) & (birth.dt.day > today.day))
+    return (years - before_birthday.astype("float64")).where(birth.notna())
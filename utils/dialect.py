@@ -0,0 +1,98 @@
+"""Détection encodage/séparateur d'un CSV sur un préfixe borné.
+
+Seuls les premiers Ko du fichier sont examinés ; le fichier complet est
+ensuite lu en une seule passe par le moteur C de pandas.
+"""
+import codecs
+import csv
+import io
+from collections import Counter, namedtuple
+
+import pandas as pd
+
+SNIFF_BYTES = 64 * 1024
+SNIFF_LINES = 50
+ENCODINGS = ["utf-8", "cp1252", "latin-1"]
+SEPARATORS = [";", ",", "\t", "|"]
+
+Dialect = namedtuple("Dialect", ["encoding", "sep"])
+
+_BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+def detect_encoding(prefix, encodings=ENCODINGS):
+    for bom, enc in _BOMS:
+        if prefix.startswith(bom):
+            return enc
+    for enc in encodings:
+        # Décodeur incrémental : un caractère coupé en fin de préfixe n'est pas une erreur
+        decoder = codecs.getincrementaldecoder(enc)()
+        try:
+            decoder.decode(prefix, final=False)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def _field_counts(lines, sep):
+    return [len(row) for row in csv.reader(lines, delimiter=sep)]
+
+
+def detect_separator(text, separators=SEPARATORS):
+    """Séparateur donnant le nombre de colonnes le plus stable (et > 1)."""
+    lines = text.splitlines()
+    if len(lines) > 1:
+        lines = lines[:-1]  # dernière ligne potentiellement tronquée
+    lines = [l for l in lines[:SNIFF_LINES] if l.strip()]
+    best, best_score = None, (0, 0)
+    for sep in separators:
+        counts = _field_counts(lines, sep)
+        if not counts:
+            continue
+        n_cols, freq = Counter(counts).most_common(1)[0]
+        if n_cols < 2:
+            continue
+        score = (freq / len(counts), n_cols)
+        if score > best_score:
+            best, best_score = sep, score
+    return best
+
+
+def sniff(data, sniff_bytes=SNIFF_BYTES, encodings=ENCODINGS, separators=SEPARATORS):
+    """Dialect(encoding, sep) déduit des `sniff_bytes` premiers octets, ou None."""
+    prefix = bytes(data[:sniff_bytes])
+    encoding = detect_encoding(prefix, encodings)
+    if encoding is None:
+        return None
+    text = codecs.getincrementaldecoder(encoding)(errors="replace").decode(prefix)
+    sep = detect_separator(text, separators)
+    if sep is None:
+        return None
+    return Dialect(encoding, sep)
+
+
+def read_csv_bytes(data, dialect, **kwargs):
+    """Lecture complète en une passe (moteur C) avec le dialecte détecté."""
+    try:
+        return pd.read_csv(io.BytesIO(data), sep=dialect.sep, encoding=dialect.encoding, engine="c", **kwargs)
+    except UnicodeDecodeError:
+        # Octet non UTF-8 au-delà du préfixe : cp1252 couvre nos exports Windows
+        if dialect.encoding not in ("utf-8", "utf-8-sig"):
+            raise
+        return pd.read_csv(io.BytesIO(data), sep=dialect.sep, encoding="cp1252", engine="c", **kwargs)
+
+
+def head_lines(data, n, encoding, sniff_bytes=SNIFF_BYTES):
+    """Les `n` premières lignes décodées, lues sur un préfixe (agrandi si besoin)."""
+    size = sniff_bytes
+    while True:
+        prefix = bytes(data[:size])
+        lines = codecs.getincrementaldecoder(encoding)(errors="replace").decode(prefix).splitlines()
+        if len(lines) > n or size >= len(data):
+            return lines[:n]
+        size *= 2
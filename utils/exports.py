@@ -0,0 +1,307 @@
+"""Exports générés à la demande : Excel, et pour les ré-imports Parquet, CSV gzip, Arrow.
+
+`export` (et `excel_export`) retourne un appelable pour `st.download_button(data=...)` :
+le classeur n'est construit que lorsque l'utilisateur clique, et non à chaque
+rerun. Le résultat est mémorisé par empreinte du contenu exporté (mêmes
+tableaux, mêmes filtres = même fichier) : les téléchargements suivants sont
+servis depuis le cache.
+
+Le classeur est écrit en flux (xlsxwriter `constant_memory`) : les lignes sont
+converties par blocs et écrites dans l'ordre, sans garder les cellules en
+mémoire, vers un fichier temporaire qui déborde sur disque au-delà de
+`EXPORT_SPOOL_MB`. Débit (lignes/s) et pic mémoire de chaque construction
+sont reportés dans `export_stats()`.
+
+Parquet, CSV gzip et Arrow IPC sont mono-table : un export d'une seule
+feuille donne le fichier seul, plusieurs feuilles une archive zip d'un
+fichier par feuille. Tous passent par `export_bytes` (même fichier
+temporaire, même cache, mêmes mesures).
+"""
+import datetime
+import os
+import re
+import threading
+import time
+import zipfile
+from collections import namedtuple
+from tempfile import SpooledTemporaryFile
+
+import pandas as pd
+import xlsxwriter
+
+from utils.columnar_cache import arrow_safe
+from utils.ingestion import ParseCache, content_key
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:  # exports Parquet / Arrow indisponibles, Excel et CSV seulement
+    pa = None
+
+# Budget mémoire des classeurs mémorisés (Mo)
+EXPORT_CACHE_MB = int(os.environ.get("VENTESABOS_EXPORT_CACHE_MB", "128"))
+# Taille au-delà de laquelle le classeur en cours d'écriture passe sur disque (Mo)
+EXPORT_SPOOL_MB = int(os.environ.get("VENTESABOS_EXPORT_SPOOL_MB", "16"))
+# Lignes converties à la fois (mémoire de travail bornée)
+CHUNK_ROWS = 10_000
+# gzip 6 : presque la taille du niveau 9 pour une fraction du temps
+CSV_GZIP_LEVEL = 6
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Types écrits tels quels par xlsxwriter ; le reste (Period, Decimal...) en texte
+_NATIVE = (str, bool, int, float, datetime.datetime, datetime.date, datetime.time, datetime.timedelta)
+# Même présentation que pd.ExcelWriter
+_HEADER = {"bold": True, "border": 1, "align": "center", "valign": "top"}
+_INDEX = {"bold": True, "border": 1, "valign": "top"}
+_DATETIME = "yyyy-mm-dd hh:mm:ss"
+
+
+class ExportCache(ParseCache):
+    """Cache LRU borné en octets : empreinte des tableaux -> fichier exporté, avec débit d'écriture."""
+
+    sizeof = staticmethod(len)
+
+    def __init__(self, max_bytes):
+        super().__init__(max_bytes)
+        self.builds = 0
+        self.rows = 0
+        self.build_seconds = 0.0
+        self.peak_bytes = 0
+        self._build_lock = threading.Lock()
+
+    def record_build(self, rows, seconds, peak_bytes):
+        with self._build_lock:
+            self.builds += 1
+            self.rows += rows
+            self.build_seconds += seconds
+            self.peak_bytes = max(self.peak_bytes, peak_bytes)
+
+    def stats(self):
+        stats = super().stats()
+        with self._build_lock:
+            stats["builds"] = self.builds
+            stats["rows_written"] = self.rows
+            stats["build_seconds"] = self.build_seconds
+            stats["rows_per_s"] = self.rows / self.build_seconds if self.build_seconds else 0.0
+            stats["peak_mb"] = self.peak_bytes / (1024 * 1024)
+        return stats
+
+
+_cache = ExportCache(EXPORT_CACHE_MB * 1024 * 1024)
+
+
+def export_stats():
+    return _cache.stats()
+
+
+def process_rss():
+    """Mémoire résidente du processus (octets) ; 0 si /proc n'est pas disponible."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _cells(values):
+    """Valeurs d'une colonne -> cellules xlsxwriter (None = vide, comme na_rep="")."""
+    s = pd.Series(values)
+    if isinstance(s.dtype, pd.DatetimeTZDtype):
+        s = s.dt.tz_localize(None)
+    elif isinstance(s.dtype, pd.PeriodDtype):
+        s = s.dt.to_timestamp()  # comme pandas : début de la période
+    cells = s.astype(object).where(s.notna(), None).tolist()
+    if pd.api.types.is_float_dtype(s.dtype):
+        return [v if v is None or abs(v) != float("inf") else ("inf" if v > 0 else "-inf") for v in cells]
+    if pd.api.types.is_numeric_dtype(s.dtype) or pd.api.types.is_datetime64_any_dtype(s.dtype):
+        return cells
+    return [v if v is None or isinstance(v, _NATIVE) else str(v) for v in cells]
+
+
+def _is_date(values):
+    return pd.api.types.is_datetime64_any_dtype(values) or isinstance(getattr(values, "dtype", values), pd.PeriodDtype)
+
+
+def _write_sheet(workbook, name, df, index, formats, on_chunk):
+    """Écrit une feuille ligne par ligne ; retourne le nombre de lignes de données."""
+    if isinstance(df, pd.Series):
+        df = df.to_frame()
+    ws = workbook.add_worksheet(name)
+    levels = df.index.nlevels if index else 0
+    date = formats["date"]
+    # Formats de colonne posés avant toute ligne (obligatoire en constant_memory)
+    for j in range(df.shape[1]):
+        if _is_date(df.dtypes.iloc[j]):
+            ws.set_column(levels + j, levels + j, None, date)
+    index_formats = [formats["index_date"] if _is_date(df.index.get_level_values(k)) else formats["index"]
+                     for k in range(levels)]
+
+    # En-têtes : un rang par niveau de colonnes, noms d'index sur le dernier
+    header_rows = df.columns.nlevels
+    for level in range(header_rows):
+        labels = df.columns.get_level_values(level) if header_rows > 1 else df.columns
+        ws.write_row(level, levels, [str(v) for v in labels], formats["header"])
+    for k in range(levels):
+        label = df.index.names[k]
+        ws.write(header_rows - 1, k, "" if label is None else str(label), formats["header"])
+
+    row = header_rows
+    previous = None
+    for start in range(0, len(df), CHUNK_ROWS):
+        chunk = df.iloc[start:start + CHUNK_ROWS]
+        index_cols = [_cells(chunk.index.get_level_values(k)) for k in range(levels)]
+        data_cols = [_cells(chunk.iloc[:, j]) for j in range(chunk.shape[1])]
+        for i, values in enumerate(zip(*data_cols) if data_cols else [()] * len(chunk)):
+            labels = tuple(col[i] for col in index_cols)
+            for k in range(levels):
+                # Niveaux externes répétés laissés vides (cellules fusionnées chez pandas)
+                if k < levels - 1 and previous is not None and labels[:k + 1] == previous[:k + 1]:
+                    continue
+                ws.write(row, k, labels[k], index_formats[k])
+            previous = labels
+            ws.write_row(row, levels, values)
+            row += 1
+        on_chunk()
+    return len(df)
+
+
+def write_workbook(sheets, output, index=True, on_chunk=None):
+    """Classeur xlsx en flux dans `output` (chemin ou fichier) ; retourne le nombre de lignes écrites."""
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    formats = {
+        "header": workbook.add_format(_HEADER),
+        "index": workbook.add_format(_INDEX),
+        "index_date": workbook.add_format({**_INDEX, "num_format": _DATETIME}),
+        "date": workbook.add_format({"num_format": _DATETIME}),
+    }
+    rows = 0
+    try:
+        for name, df in sheets.items():
+            rows += _write_sheet(workbook, name, df, index, formats, on_chunk or (lambda: None))
+    finally:
+        workbook.close()
+    return rows
+
+
+# --- Formats mono-table (Parquet, CSV gzip, Arrow IPC) ---
+
+def _arrow_table(df, index):
+    """Table Arrow du DataFrame ; colonnes à types mélangés converties en texte (copie seulement si besoin)."""
+    preserve = None if index else False  # None : RangeIndex en métadonnées, autre index en colonne
+    # En-têtes de tableaux croisés (catégories, périodes, multi-niveaux) ramenés à du texte simple
+    df = df.set_axis([" / ".join(map(str, c)) if isinstance(c, tuple) else str(c) for c in df.columns], axis=1)
+    try:
+        return pa.Table.from_pandas(df, preserve_index=preserve)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # L'index (ex. semaines en objets Period) passe en colonnes pour être converti lui aussi
+        df = df.reset_index() if index and not isinstance(df.index, pd.RangeIndex) else df.copy()
+        return pa.Table.from_pandas(arrow_safe(df), preserve_index=preserve)
+
+
+def write_parquet(df, output, index=True):
+    pq.write_table(_arrow_table(df, index), output)
+
+
+def write_arrow(df, output, index=True):
+    feather.write_feather(_arrow_table(df, index), output)  # fichier IPC Arrow (Feather v2), compressé lz4
+
+
+def write_csv_gz(df, output, index=True):
+    df.to_csv(output, index=index, encoding="utf-8", compression={"method": "gzip", "compresslevel": CSV_GZIP_LEVEL})
+
+
+def _entry_name(sheet, extension):
+    return re.sub(r'[<>:"/\\|?*]', "_", sheet) + extension
+
+
+def _tables(write, extension):
+    """Format mono-table : le fichier seul pour une feuille, sinon une archive zip d'un fichier par feuille."""
+    def write_all(sheets, output, index=True, on_chunk=None):
+        frames = {name: df.to_frame() if isinstance(df, pd.Series) else df for name, df in sheets.items()}
+        if len(frames) == 1:
+            (df,) = frames.values()
+            write(df, output, index)
+        else:
+            # Fichiers déjà compressés : stockés tels quels dans l'archive
+            with zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as archive:
+                for name, df in frames.items():
+                    with archive.open(_entry_name(name, extension), "w") as entry:
+                        write(df, entry, index)
+                    if on_chunk:
+                        on_chunk()
+        return sum(len(df) for df in frames.values())
+    return write_all
+
+
+Format = namedtuple("Format", "label extension mime write")
+
+FORMATS = {"xlsx": Format("Excel", ".xlsx", XLSX_MIME, write_workbook)}
+if pa is not None:
+    FORMATS["parquet"] = Format("Parquet", ".parquet", "application/vnd.apache.parquet", _tables(write_parquet, ".parquet"))
+FORMATS["csv.gz"] = Format("CSV (gzip)", ".csv.gz", "application/gzip", _tables(write_csv_gz, ".csv.gz"))
+if pa is not None:
+    FORMATS["arrow"] = Format("Arrow", ".arrow", "application/vnd.apache.arrow.file", _tables(write_arrow, ".arrow"))
+
+
+def export_file_name(file_name, fmt, sheets):
+    """Nom du fichier téléchargé : `analyse.xlsx` -> `analyse.parquet`, ou `analyse-parquet.zip` si plusieurs feuilles."""
+    stem = file_name[:-len(".xlsx")] if file_name.endswith(".xlsx") else file_name
+    if fmt == "xlsx" or len(sheets) == 1:
+        return stem + FORMATS[fmt].extension
+    return f"{stem}-{fmt.replace('.', '-')}.zip"
+
+
+def export_mime(fmt, sheets):
+    return FORMATS[fmt].mime if fmt == "xlsx" or len(sheets) == 1 else "application/zip"
+
+
+def export_bytes(sheets, fmt="xlsx", index=True):
+    """Fichier exporté (une feuille / un tableau par DataFrame de `sheets`), écrit en flux via un fichier temporaire."""
+    start_rss = peak_rss = process_rss()
+
+    def sample():
+        nonlocal peak_rss
+        peak_rss = max(peak_rss, process_rss())
+
+    start = time.perf_counter()
+    with SpooledTemporaryFile(max_size=EXPORT_SPOOL_MB * 1024 * 1024) as spool:
+        rows = FORMATS[fmt].write(sheets, spool, index, on_chunk=sample)
+        sample()
+        spool.seek(0)
+        data = spool.read()
+    sample()
+    _cache.record_build(rows, time.perf_counter() - start, peak_rss - start_rss)
+    return data
+
+
+def export(sheets, fmt="xlsx", index=True):
+    """Appelable sans argument : fichier construit au premier clic, puis mémorisé."""
+    def build():
+        key = content_key(fmt, index, list(sheets), list(sheets.values()))
+        data = _cache.get(key)
+        if data is None:
+            data = export_bytes(sheets, fmt, index)
+            _cache.put(key, data)
+        return data
+    return build
+
+
+def excel_export(sheets, index=True):
+    """Appelable du classeur Excel (voir `export`)."""
+    return export(sheets, "xlsx", index)
+
+
+def export_buttons(label, sheets, file_name, index=True):
+    """Bouton Excel habituel, suivi des mêmes données dans les formats rapides (Parquet, CSV gzip, Arrow)."""
+    import streamlit as st
+    st.download_button(label, data=excel_export(sheets, index), file_name=file_name, mime=XLSX_MIME)
+    others = [fmt for fmt in FORMATS if fmt != "xlsx"]
+    for col, fmt in zip(st.columns(len(others)), others):
+        col.download_button(
+            f"⬇️ {FORMATS[fmt].label}",
+            data=export(sheets, fmt, index),
+            file_name=export_file_name(file_name, fmt, sheets),
+            mime=export_mime(fmt, sheets),
+            key=f"{file_name}:{fmt}",
+        )
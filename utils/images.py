@@ -0,0 +1,212 @@
+"""Vignettes produits du Catalogue : stockage disque et préchargement.
+
+Les vignettes (redimensionnées) sont conservées sur disque et survivent aux
+redémarrages. Les vignettes manquantes sont récupérées en arrière-plan par un
+pool de threads borné pendant que la grille affiche des emplacements vides.
+La source des images est un simple appelable `fetch(produit) -> bytes | None`,
+remplaçable (ex. serveur local de test). Un disjoncteur suspend les
+recherches après plusieurs échecs consécutifs (service lent ou hors ligne)
+et les produits sans image connue ne sont pas recherchés à chaque rerun.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import requests
+from PIL import Image
+
+from utils.columnar_cache import CACHE_DIR
+
+THUMBNAIL_DIR = os.path.join(CACHE_DIR, "thumbnails")
+THUMBNAIL_SIZE = (300, 300)
+PREFETCH_WORKERS = 4
+# Délais (connexion, lecture) par requête HTTP, en secondes
+FETCH_TIMEOUT = (3, 5)
+# Produits sans image : pas de nouvelle recherche avant ce délai
+NEGATIVE_TTL_S = 7 * 24 * 3600
+BREAKER_MAX_FAILURES = 3
+BREAKER_COOLDOWN_S = 120
+
+
+class ImageStore:
+    """Vignettes JPEG sur disque, une par produit."""
+
+    def __init__(self, directory=THUMBNAIL_DIR, size=THUMBNAIL_SIZE):
+        self.directory = directory
+        self.size = size
+
+    def path(self, product):
+        name = hashlib.sha1(str(product).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.jpg")
+
+    def get(self, product):
+        path = self.path(product)
+        return path if os.path.exists(path) else None
+
+    def _missing_path(self, product):
+        return self.path(product)[:-len(".jpg")] + ".none"
+
+    def mark_missing(self, product):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._missing_path(product), "w"):
+            pass
+
+    def is_missing(self, product, ttl=NEGATIVE_TTL_S):
+        try:
+            return time.time() - os.path.getmtime(self._missing_path(product)) < ttl
+        except OSError:
+            return False
+
+    def put(self, product, data):
+        img = Image.open(BytesIO(data)).convert("RGB")
+        img.thumbnail(self.size)
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(product)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        img.save(tmp, format="JPEG", quality=85)
+        os.replace(tmp, path)
+        return path
+
+
+class SearchBlocked(RuntimeError):
+    """Page de recherche sans jeton vqd : limitation de débit ou requête bloquée."""
+
+
+class DuckDuckGoFetcher:
+    """Recherche d'image (jeton vqd puis i.js) et téléchargement de la première image."""
+
+    def __init__(self, base_url="https://duckduckgo.com", timeout=FETCH_TIMEOUT, session=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def image_url(self, product):
+        res = self.session.post(f"{self.base_url}/", data={"q": product}, timeout=self.timeout)
+        res.raise_for_status()
+        search = re.search(r'vqd=([\d-]+)\&', res.text, re.M | re.I)
+        if not search:
+            # Échec du service (compté par le disjoncteur), pas une absence d'image
+            raise SearchBlocked(f"jeton vqd absent pour {product!r}")
+        params = (
+            ('l', 'fr-fr'),
+            ('o', 'json'),
+            ('q', product),
+            ('vqd', search.group(1)),
+            ('f', ',,,'),
+            ('p', '1'),
+            ('v7exp', 'a')
+        )
+        resp = self.session.get(f"{self.base_url}/i.js", headers={'User-Agent': 'Mozilla/5.0'}, params=params, timeout=self.timeout)
+        results = resp.json().get("results") or []
+        return results[0]["image"] if results else None
+
+    def __call__(self, product):
+        url = self.image_url(product)
+        if not url:
+            return None
+        resp = self.session.get(url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.content
+
+
+class CircuitBreaker:
+    """Ouvert après `max_failures` échecs consécutifs ; un seul essai autorisé après `cooldown` secondes."""
+
+    def __init__(self, max_failures=BREAKER_MAX_FAILURES, cooldown=BREAKER_COOLDOWN_S, clock=time.monotonic):
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self.opened_at is not None and self.clock() - self.opened_at < self.cooldown
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.clock() - self.opened_at >= self.cooldown:
+                self.opened_at = self.clock()  # demi-ouvert : les autres attendent le résultat de cet essai
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                self.opened_at = self.clock()
+
+
+class ThumbnailPrefetcher:
+    """Récupère en arrière-plan les vignettes absentes du store."""
+
+    def __init__(self, store, fetcher, max_workers=PREFETCH_WORKERS, breaker=None):
+        self.store = store
+        self.fetcher = fetcher
+        self.breaker = breaker or CircuitBreaker()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thumbnails")
+        self._pending = set()
+        self._done = threading.Condition()
+
+    def request(self, products):
+        """Programme les produits sans vignette ; retourne le nombre de téléchargements en cours."""
+        with self._done:
+            if self.breaker.is_open:
+                return len(self._pending)
+            for product in products:
+                if product in self._pending or self.store.get(product) or self.store.is_missing(product):
+                    continue
+                self._pending.add(product)
+                self._pool.submit(self._fetch, product)
+            return len(self._pending)
+
+    def pending(self):
+        with self._done:
+            return len(self._pending)
+
+    def wait(self, timeout):
+        """Attend la fin des téléchargements en cours, au plus `timeout` secondes (budget de rendu)."""
+        deadline = time.monotonic() + timeout
+        with self._done:
+            while self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._done.wait(remaining)
+            return len(self._pending)
+
+    def _fetch(self, product):
+        try:
+            if not self.breaker.allow():
+                return
+            try:
+                data = self.fetcher(product)
+            except Exception:
+                self.breaker.failure()
+                return
+            self.breaker.success()
+            if not data:
+                self.store.mark_missing(product)
+                return
+            try:
+                self.store.put(product, data)
+            except Exception:
+                # Image illisible (décodage PIL...) : ce produit seulement, le service répond
+                self.store.mark_missing(product)
+        finally:
+            with self._done:
+                self._pending.discard(product)
+                self._done.notify_all()
@@ -0,0 +1,202 @@
+"""Lecture des fichiers importés avec cache partagé entre pages et sessions.
+
+Le contenu importé est haché (SHA-256) : un même export ré-importé sur une
+autre page, ou relu à chaque rerun Streamlit, est servi depuis le cache sans
+être reparsé.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from utils.columnar_cache import read_excel_cached
+from utils.dialect import Dialect, detect_encoding, read_csv_bytes, sniff
+
+# Budget mémoire du cache (Mo), configurable par variable d'environnement
+PARSE_CACHE_MB = int(os.environ.get("VENTESABOS_PARSE_CACHE_MB", "512"))
+
+
+class ParseCache:
+    """Cache LRU borné en octets : empreinte du fichier -> DataFrame nettoyé."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    @staticmethod
+    def sizeof(df):
+        return int(df.memory_usage(deep=True).sum())
+
+    def put(self, key, df):
+        size = self.sizeof(df)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (df, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self.nbytes -= old_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+_cache = ParseCache(PARSE_CACHE_MB * 1024 * 1024)
+
+
+def cache_stats():
+    return _cache.stats()
+
+
+def file_bytes(file):
+    """Contenu brut d'un fichier importé (UploadedFile ou objet fichier)."""
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    file.seek(0)
+    return file.read()
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+_upload_keys = OrderedDict()  # file_id Streamlit -> empreinte, pour ne pas rehacher à chaque rerun
+_upload_keys_lock = threading.Lock()
+
+
+def upload_fingerprint(file):
+    """Empreinte du contenu d'un fichier importé, calculée une fois par import (file_id)."""
+    file_id = getattr(file, "file_id", None)
+    if file_id is None:
+        return fingerprint(file_bytes(file))
+    with _upload_keys_lock:
+        key = _upload_keys.get(file_id)
+        if key is not None:
+            _upload_keys.move_to_end(file_id)
+            return key
+    key = fingerprint(file_bytes(file))
+    with _upload_keys_lock:
+        _upload_keys[file_id] = key
+        while len(_upload_keys) > 256:
+            _upload_keys.popitem(last=False)
+    return key
+
+
+def _hash_into(h, obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        h.update(type(obj).__name__.encode())
+        h.update(pd.util.hash_pandas_object(obj, index=not isinstance(obj, pd.Index)).to_numpy().tobytes())
+        if isinstance(obj, pd.DataFrame):
+            labels, dtypes = list(obj.columns), list(obj.dtypes.astype(str))
+        else:
+            labels, dtypes = [obj.name], [str(obj.dtype)]
+        h.update(repr((labels, dtypes, getattr(obj.index, "names", None))).encode())
+    elif isinstance(obj, np.ndarray):
+        h.update(repr((obj.shape, str(obj.dtype))).encode())
+        h.update(pd.util.hash_array(obj.ravel()).tobytes() if obj.dtype == object else np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (bytes, bytearray)):
+        h.update(obj)
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"{type(obj).__name__}{len(obj)}".encode())
+        for item in obj:
+            _hash_into(h, item)
+    else:
+        h.update(repr(obj).encode())
+    h.update(b"\0")
+
+
+def content_key(*objs):
+    """Empreinte SHA-256 d'objets pandas / numpy / scalaires (valeurs, libellés et types)."""
+    h = hashlib.sha256()
+    for obj in objs:
+        _hash_into(h, obj)
+    return h.hexdigest()
+
+
+def clean_columns(df):
+    df.columns = [str(c).strip() for c in df.columns]
+    return df
+
+
+def _parse_csv(data):
+    # Dialecte déduit d'un préfixe, puis une seule lecture complète (moteur C)
+    dialect = sniff(data)
+    if dialect is None:
+        # Fichier à une seule colonne (ou illisible)
+        encoding = detect_encoding(bytes(data[:4096]))
+        if encoding is None:
+            raise ValueError("Impossible de lire le fichier CSV.")
+        dialect = Dialect(encoding, ",")
+    try:
+        return read_csv_bytes(data, dialect)
+    except Exception as e:
+        raise ValueError(f"Impossible de lire le fichier CSV : {e}") from e
+
+
+def _parse_excel(data):
+    return read_excel_cached(data)
+
+
+def read_upload(file, copy=True):
+    """DataFrame (colonnes nettoyées) d'un CSV/Excel importé, via le cache.
+
+    Retourne une copie : les pages peuvent la modifier sans altérer le cache.
+    `copy=False` rend le DataFrame du cache lui-même, pour une lecture seule.
+    Lève ValueError si le fichier est illisible.
+    """
+    is_csv = file.name.lower().endswith(".csv")
+    key = ("csv" if is_csv else "xlsx", upload_fingerprint(file))
+    df = _cache.get(key)
+    if df is None:
+        data = file_bytes(file)
+        df = _parse_csv(data) if is_csv else _parse_excel(data)
+        df = clean_columns(df)
+        _cache.put(key, df)
+    return df.copy() if copy else df
+
+
+def read_upload_or_stop(file, message="Impossible de lire le fichier. Essayez de l'enregistrer à nouveau en UTF-8 ou Excel.", copy=True):
+    """`read_upload` pour les pages : si le fichier est illisible, affiche `message` et arrête le rerun."""
+    import streamlit as st
+    try:
+        return read_upload(file, copy=copy)
+    except Exception:
+        st.error(message)
+        st.stop()
@@ -0,0 +1,41 @@
+"""Conversion des montants texte (formats français / marocains) en nombres.
+
+Gère "1 234,50 MAD", espaces insécables (fines ou non), "dh"/"DHS",
+séparateurs de milliers "." ou ",". Chaque valeur distincte n'est parsée
+qu'une fois : les montants répétés (650, 700 MAD...) sont fréquents.
+"""
+import numpy as np
+import pandas as pd
+
+_SPACES = "[\\s\u00a0\u202f\u2009]"
+_CURRENCY = r"(?i)MAD|DHS?"
+_NUMBER = r"([-+]?\d*\.?\d+)"
+
+
+def _parse_unique(values, extract):
+    s = pd.Series(values, dtype=object).astype(str)
+    s = s.str.replace(_SPACES, "", regex=True).str.replace(_CURRENCY, "", regex=True)
+    # "1.234,50" / "1,234.50" : le dernier séparateur est la décimale
+    both = s.str.contains(",", regex=False) & s.str.contains(".", regex=False)
+    if both.any():
+        comma_decimal = s.str.rfind(",") > s.str.rfind(".")
+        s = s.mask(both & comma_decimal, s.str.replace(".", "", regex=False))
+        s = s.mask(both & ~comma_decimal, s.str.replace(",", "", regex=False))
+    s = s.str.replace(",", ".", regex=False)
+    if extract:
+        s = s.str.extract(_NUMBER, expand=False)
+    return pd.to_numeric(s, errors="coerce").to_numpy(dtype="float64")
+
+
+def parse_amounts(values, extract=False):
+    """Series float (NaN si illisible) à partir d'une colonne de montants.
+
+    extract=True garde le premier nombre trouvé dans le texte (ex. "Total: 650 dh")
+    au lieu de rejeter toute valeur contenant autre chose qu'un montant.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.astype("float64")
+    codes, uniques = pd.factorize(values)
+    parsed = np.append(_parse_unique(uniques, extract), np.nan)
+    return pd.Series(parsed[codes], index=values.index, name=values.name)
@@ -0,0 +1,33 @@
+"""Agrégations du recouvrement (incidents de paiement) par commercial."""
+import pandas as pd
+
+# Libellés des colonnes du tableau commercial (page Recouvrement)
+COM_TAB_COLUMNS = (
+    "Nb_Incidents", "Nb_Recouverts", "Nb_a_Recouvrir",
+    "Montant_Total", "Montant_Recouvert", "Montant_a_Recouvrir",
+)
+
+
+def commercial_table(df, commercial_col, montant_col, recouvert_col="Recouvert", columns=COM_TAB_COLUMNS):
+    """Tableau par commercial en un seul groupby.
+
+    Les montants recouvrés / impayés sont dérivés une fois par masque
+    vectorisé, au lieu de re-filtrer le DataFrame pour chaque commercial.
+    Colonnes (dans l'ordre de `columns`) : nb incidents (montants
+    renseignés), nb recouverts, nb montants manquants, montant total,
+    montant recouvert, montant impayé.
+    """
+    montant = df[montant_col]
+    recouvert = df[recouvert_col].astype(bool)
+    parts = pd.DataFrame({
+        columns[0]: montant.notna(),
+        columns[1]: df[recouvert_col],
+        columns[2]: montant.isna(),
+        columns[3]: montant,
+        columns[4]: montant.where(recouvert),
+        columns[5]: montant.where(~recouvert),
+    }, index=df.index)
+    table = parts.groupby(df[commercial_col]).sum()
+    for col in columns[:3]:
+        table[col] = table[col].astype("int64")
+    return table
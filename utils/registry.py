@@ -0,0 +1,338 @@
+"""Registre des résultats calculés par les pages, pour l'Export Global.
+
+Chaque page publie ses tableaux (`publish(page, tables)`) ; l'Export Global
+les relit pour la session courante. Le registre est borné en mémoire par
+session et pour tout le processus : au-delà, les résultats les moins
+récemment utilisés sont déchargés sur disque (pickle gzip, types pandas
+conservés) et relus à la demande. Un tableau republié à l'identique (même
+empreinte) n'est ni recopié ni réécrit. Les résultats des sessions fermées
+sont supprimés.
+
+Publication et assemblage du classeur global (`assemble`) passent par un
+même thread d'arrière-plan, dans l'ordre : les reruns n'attendent ni le
+calcul des empreintes ni l'écriture du classeur.
+"""
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from utils.columnar_cache import CACHE_DIR
+from utils.ingestion import content_key
+
+REGISTRY_DIR = os.path.join(CACHE_DIR, "registry")
+# Budgets mémoire (Mo) : par session et pour l'ensemble des sessions
+SESSION_BUDGET_MB = int(os.environ.get("VENTESABOS_REGISTRY_SESSION_MB", "128"))
+GLOBAL_BUDGET_MB = int(os.environ.get("VENTESABOS_REGISTRY_MB", "512"))
+SPILL_GZIP_LEVEL = 1
+
+
+class _Result:
+    __slots__ = ("seq", "key", "df", "nbytes", "path")
+
+    def __init__(self, seq, key, df, nbytes):
+        self.seq = seq        # ordre de première publication (ordre des feuilles exportées)
+        self.key = key
+        self.df = df          # None si déchargé sur disque
+        self.nbytes = nbytes
+        self.path = None
+
+
+class ResultRegistry:
+    """Résultats par (session, nom), LRU borné en octets par session et globalement, débordement sur disque."""
+
+    @staticmethod
+    def sizeof(df):
+        usage = df.memory_usage(deep=True)  # Series : un entier
+        return int(usage.sum() if isinstance(df, pd.DataFrame) else usage)
+
+    def __init__(self, session_budget, global_budget, directory=REGISTRY_DIR):
+        self.session_budget = session_budget
+        self.global_budget = global_budget
+        self.directory = directory
+        self._entries = OrderedDict()   # (session, nom) -> _Result, du moins au plus récemment utilisé
+        self._generations = {}          # session -> compteur de modifications
+        self._seq = 0
+        self._lock = threading.RLock()
+        self.nbytes = 0
+        self.spills = 0
+        self.loads = 0
+
+    def _session_bytes(self, session):
+        return sum(r.nbytes for (s, _), r in self._entries.items() if s == session and r.df is not None)
+
+    def _path(self, session, name):
+        digest = hashlib.sha1(f"{session}\0{name}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, hashlib.sha1(session.encode("utf-8")).hexdigest(), f"{digest}.pkl.gz")
+
+    def _spill(self, id_, result):
+        path = self._path(*id_)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        result.df.to_pickle(tmp, compression={"method": "gzip", "compresslevel": SPILL_GZIP_LEVEL})
+        os.replace(tmp, path)
+        result.df, result.path = None, path
+        self.nbytes -= result.nbytes
+        self.spills += 1
+
+    def _enforce(self, session):
+        """Décharge les résultats les plus anciens jusqu'à respecter les deux budgets."""
+        over = self._session_bytes(session) - self.session_budget
+        for id_, result in list(self._entries.items()):
+            if over <= 0:
+                break
+            if id_[0] == session and result.df is not None:
+                self._spill(id_, result)
+                over -= result.nbytes
+        for id_, result in list(self._entries.items()):
+            if self.nbytes <= self.global_budget:
+                break
+            if result.df is not None:
+                self._spill(id_, result)
+
+    def _discard(self, id_):
+        result = self._entries.pop(id_, None)
+        if result is None:
+            return
+        if result.df is not None:
+            self.nbytes -= result.nbytes
+        if result.path:
+            try:
+                os.remove(result.path)
+            except FileNotFoundError:
+                pass
+
+    def publish(self, session, name, df):
+        """Enregistre (ou remplace) un résultat ; sans effet si le contenu n'a pas changé."""
+        key = content_key(df)
+        id_ = (session, name)
+        with self._lock:
+            current = self._entries.get(id_)
+            if current is not None and current.key == key:
+                self._entries.move_to_end(id_)
+                return False
+            self._discard(id_)
+            if current is None:
+                self._seq += 1
+            seq = current.seq if current is not None else self._seq
+            result = self._entries[id_] = _Result(seq, key, df, self.sizeof(df))
+            self.nbytes += result.nbytes
+            self._generations[session] = self._generations.get(session, 0) + 1
+            self._enforce(session)
+            return True
+
+    def remove(self, session, name):
+        """Retire un résultat (mémoire et disque) ; vrai s'il existait."""
+        id_ = (session, name)
+        with self._lock:
+            if id_ not in self._entries:
+                return False
+            self._discard(id_)
+            self._generations[session] = self._generations.get(session, 0) + 1
+            return True
+
+    def get(self, session, name, promote=True):
+        """Résultat publié (relu sur disque si déchargé) ou None. `promote=False` : relecture sans le remettre en mémoire."""
+        id_ = (session, name)
+        with self._lock:
+            result = self._entries.get(id_)
+            if result is None:
+                return None
+            self._entries.move_to_end(id_)
+            if result.df is not None:
+                return result.df
+            df = pd.read_pickle(result.path, compression="gzip")
+            self.loads += 1
+            if promote and result.nbytes <= self.session_budget:
+                result.df = df
+                self.nbytes += result.nbytes
+                self._enforce(session)
+            return df
+
+    def names(self, session):
+        """Noms des résultats de la session, dans l'ordre de première publication."""
+        with self._lock:
+            found = [(r.seq, name) for (s, name), r in self._entries.items() if s == session]
+            return [name for _, name in sorted(found)]
+
+    def generation(self, session):
+        with self._lock:
+            return self._generations.get(session, 0)
+
+    def compact_session(self, session):
+        """Décharge sur disque tous les résultats en mémoire de la session ; retourne les octets libérés.
+
+        Le verrou est repris pour chaque résultat : les autres sessions n'attendent qu'une écriture à la fois.
+        """
+        with self._lock:
+            ids = [id_ for id_, result in self._entries.items() if id_[0] == session and result.df is not None]
+        freed = 0
+        for id_ in ids:
+            with self._lock:
+                result = self._entries.get(id_)
+                if result is not None and result.df is not None:
+                    self._spill(id_, result)
+                    freed += result.nbytes
+        return freed
+
+    def drop_session(self, session):
+        with self._lock:
+            for id_ in [id_ for id_ in self._entries if id_[0] == session]:
+                self._discard(id_)
+            self._generations.pop(session, None)
+        shutil.rmtree(os.path.dirname(self._path(session, "")), ignore_errors=True)
+
+    def sessions(self):
+        with self._lock:
+            return {s for s, _ in self._entries}
+
+    def prune(self, is_active):
+        """Supprime les résultats des sessions fermées (`is_active(session)` faux)."""
+        for session in self.sessions():
+            if not is_active(session):
+                self.drop_session(session)
+
+    def session_stats(self, session):
+        with self._lock:
+            results = [r for (s, _), r in self._entries.items() if s == session]
+            return {
+                "results": len(results),
+                "bytes": sum(r.nbytes for r in results if r.df is not None),
+                "spilled": sum(1 for r in results if r.df is None),
+                "budget_bytes": self.session_budget,
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len({s for s, _ in self._entries}),
+                "results": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.global_budget,
+                "spilled": sum(1 for r in self._entries.values() if r.df is None),
+                "spills": self.spills,
+                "loads": self.loads,
+            }
+
+
+_registry = ResultRegistry(SESSION_BUDGET_MB * 1024 * 1024, GLOBAL_BUDGET_MB * 1024 * 1024)
+_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="registry")
+_jobs = {}   # (session, nom) -> (génération, Future)
+_pending = {}  # (session, nom) -> dernier DataFrame publié, pas encore enregistré
+_state_lock = threading.Lock()
+
+
+def registry_stats():
+    return _registry.stats()
+
+
+def current_session():
+    """Identifiant de la session Streamlit en cours ("local" hors serveur)."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "local"
+
+
+def session_active(session):
+    """Vrai tant que le runtime Streamlit garde la session ouverte (toujours vrai hors serveur)."""
+    from streamlit import runtime
+    return not runtime.exists() or runtime.get_instance().is_active_session(session)
+
+
+def _publish_latest(id_):
+    with _state_lock:
+        df = _pending.pop(id_)
+    _registry.prune(session_active)
+    if df is None:
+        _registry.remove(*id_)
+    else:
+        _registry.publish(*id_, df)
+
+
+def publish(page, tables):
+    """Publie les tableaux d'une page (nom -> DataFrame/Series) pour la session en cours.
+
+    Empreinte, mesure et éventuel déchargement se font sur le thread du
+    registre : le rerun n'attend pas. Seule la dernière version en attente
+    d'un même tableau est traitée. Un tableau devenu vide (filtre) retire
+    la version publiée précédemment.
+    """
+    session = current_session()
+    for name, df in tables.items():
+        id_ = (session, f"{page}/{name}")
+        if df is None or df.empty:
+            df = None  # retrait
+            with _state_lock:
+                known = id_ in _pending
+            if not known and id_[1] not in _registry.names(session):
+                continue
+        with _state_lock:
+            scheduled = id_ in _pending
+            _pending[id_] = df
+        if not scheduled:
+            _pool.submit(_publish_latest, id_)
+
+
+def published():
+    """Noms des résultats publiés dans la session en cours ("page/tableau"), y compris ceux en attente."""
+    session = current_session()
+    with _state_lock:
+        pending = [name for (s, name), df in _pending.items() if s == session and df is not None]
+        removed = {name for (s, name), df in _pending.items() if s == session and df is None}
+    names = [name for name in _registry.names(session) if name not in removed]
+    return names + [name for name in pending if name not in names]
+
+
+def results(promote=False, session=None):
+    """Résultats de la session (nom -> DataFrame), relus sur disque si besoin."""
+    session = session or current_session()
+    tables = {}
+    for name in _registry.names(session):
+        df = _registry.get(session, name, promote=promote)
+        if df is not None:
+            tables[name] = df
+    return tables
+
+
+def session_usage(session):
+    """Compte du registre pour une session : résultats en mémoire / sur disque et classeurs assemblés."""
+    usage = _registry.session_stats(session)
+    with _state_lock:
+        jobs = [job for key, (_, job) in _jobs.items() if key[0] == session]
+    usage["assembled_bytes"] = sum(len(job.result()) for job in jobs if job.done() and job.exception() is None)
+    return usage
+
+
+def compact(session):
+    """Session inactive : résultats déchargés sur disque, classeurs assemblés libérés (refaits à la demande)."""
+    with _state_lock:
+        for key in [k for k in _jobs if k[0] == session]:
+            del _jobs[key]
+    return _registry.compact_session(session)
+
+
+def forget(session):
+    """Session fermée : résultats et classeurs assemblés supprimés."""
+    with _state_lock:
+        for key in [k for k in _jobs if k[0] == session]:
+            del _jobs[key]
+    _registry.drop_session(session)
+
+
+def assemble(name, build):
+    """Future de `build(résultats)` pour la session, calculé en arrière-plan et refait si le registre a changé."""
+    session = current_session()
+    generation = _registry.generation(session)
+    with _state_lock:
+        job = _jobs.get((session, name))
+        if job is None or job[0] != generation:
+            job = _jobs[(session, name)] = (generation, _pool.submit(lambda: build(results(session=session))))
+        # Travaux des sessions fermées : libère leurs résultats
+        live = _registry.sessions() | {session}
+        for key in [k for k in _jobs if k[0] not in live]:
+            del _jobs[key]
+    return job[1]
@@ -0,0 +1,116 @@
+"""Index des rejets (impayés) mensuels par client, pour détecter les séries.
+
+Chaque client reçoit un identifiant entier compact. Pour chaque mois appliqué
+on conserve les identifiants des clients impayés et la longueur de leur
+série de mois consécutifs en rejet : interroger un mois ne parcourt que les
+clients de ce mois, pas tout l'historique. L'index est sauvegardé sur disque
+(JSON) et enrichi mois par mois, dans un dossier durable
+(`VENTESABOS_DATA_DIR`, par défaut `data/` à la racine de l'application),
+distinct du cache temporaire qui peut être vidé à tout moment.
+"""
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from utils.columnar_cache import CACHE_DIR
+
+DATA_DIR = os.environ.get("VENTESABOS_DATA_DIR", str(Path(__file__).resolve().parent.parent / "data"))
+
+
+class RejectionIndex:
+    def __init__(self):
+        self.client_ids = {}   # clé client normalisée -> id
+        self.names = []        # id -> nom affiché
+        self.months = {}       # mois (ordinal de Period M) -> {id: longueur de série}
+        self._last = {}        # id -> dernier mois en rejet
+        self._streak = {}      # id -> série en cours au dernier mois en rejet
+
+    def _client_id(self, key, name):
+        cid = self.client_ids.get(key)
+        if cid is None:
+            cid = self.client_ids[key] = len(self.names)
+            self.names.append(name)
+        else:
+            self.names[cid] = name
+        return cid
+
+    def _apply(self, month, ids):
+        streaks = {}
+        for cid in ids:
+            streak = self._streak[cid] + 1 if self._last.get(cid) == month - 1 else 1
+            self._last[cid] = month
+            self._streak[cid] = streaks[cid] = streak
+        self.months[month] = streaks
+
+    def _rebuild(self):
+        months, self.months, self._last, self._streak = self.months, {}, {}, {}
+        for month in sorted(months):
+            self._apply(month, months[month])
+
+    def apply_month(self, period, client_keys, client_names):
+        """Ajoute (ou remplace) les clients impayés d'un mois. Retourne True si l'index a changé."""
+        month = pd.Period(period, freq="M").ordinal
+        ids = {self._client_id(k, n) for k, n in zip(client_keys, client_names)}
+        if month in self.months and set(self.months[month]) == ids:
+            return False
+        if not self.months or month > max(self.months):
+            self._apply(month, ids)  # cas courant : mois suivant, mise à jour incrémentale
+        else:
+            self.months[month] = dict.fromkeys(ids, 1)
+            self._rebuild()
+        return True
+
+    def applied_months(self):
+        return [pd.Period(ordinal=m, freq="M") for m in sorted(self.months)]
+
+    def streaks(self, period, min_streak=2):
+        """Clients en rejet au mois `period` depuis au moins `min_streak` mois consécutifs."""
+        month = pd.Period(period, freq="M").ordinal
+        rows = [(self.names[cid], streak) for cid, streak in self.months.get(month, {}).items() if streak >= min_streak]
+        return pd.DataFrame(rows, columns=["Nom complet", "Rejets successifs"]).sort_values(
+            ["Rejets successifs", "Nom complet"], ascending=[False, True], ignore_index=True
+        )
+
+    def to_json(self):
+        keys = sorted(self.client_ids, key=self.client_ids.get)
+        return json.dumps({
+            "clients": [[k, self.names[self.client_ids[k]]] for k in keys],
+            "months": {str(m): sorted(streaks) for m, streaks in self.months.items()},
+        })
+
+    @classmethod
+    def from_json(cls, text):
+        raw = json.loads(text)
+        index = cls()
+        for key, name in raw["clients"]:
+            index._client_id(key, name)
+        index.months = {int(m): dict.fromkeys(ids, 1) for m, ids in raw["months"].items()}
+        index._rebuild()
+        return index
+
+
+def index_path(owner, directory=None):
+    safe = "".join(c if c.isalnum() else "_" for c in str(owner or "anonyme"))
+    return os.path.join(directory or DATA_DIR, f"rejets_{safe}.json")
+
+
+def load_index(owner):
+    # Index enregistrés avant le dossier durable : repris depuis le cache temporaire
+    for path in (index_path(owner), index_path(owner, CACHE_DIR)):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return RejectionIndex.from_json(f.read())
+        except (OSError, ValueError, KeyError):
+            continue
+    return RejectionIndex()
+
+
+def save_index(index, owner):
+    path = index_path(owner)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(index.to_json())
+    os.replace(tmp, path)
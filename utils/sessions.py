@@ -0,0 +1,223 @@
+"""Mémoire par session et compactage des sessions inactives.
+
+Chaque page signale sa session (`track_session`) : utilisateur, page et
+heure de la dernière interaction. Le compte d'une session additionne ce que
+le processus garde pour elle : fichiers importés (tenus par Streamlit),
+valeurs de `st.session_state`, objets lourds reconstructibles
+(`session_object`), résultats publiés dans le registre et classeurs globaux
+assemblés.
+
+Une session inactive depuis `IDLE_MINUTES` est compactée : ses résultats
+du registre passent sur disque, ses classeurs assemblés et objets
+reconstructibles sont libérés. Rien n'est perdu : à l'interaction suivante
+les résultats sont relus à la demande, les objets reconstruits par leur
+fonction `build` et le classeur réassemblé. Le balayage tourne sur un
+thread d'arrière-plan toutes les `SWEEP_INTERVAL_S` secondes (démarré à la
+première page suivie) : aucun rerun ne paie le compactage des autres.
+"""
+import io
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+
+from utils import registry
+
+IDLE_MINUTES = float(os.environ.get("VENTESABOS_IDLE_MINUTES", "15"))
+SWEEP_INTERVAL_S = 30
+# Utilisateurs (users_db.csv) autorisés à voir la mémoire de toutes les sessions
+ADMINS = {u.strip() for u in os.environ.get("VENTESABOS_ADMINS", "Admin").split(",") if u.strip()}
+
+
+def sizeof(obj, _seen=None):
+    """Taille approximative (octets) d'une valeur de session, conteneurs et attributs compris."""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, io.IOBase):
+        return 0  # fichiers importés : comptés avec les imports tenus par Streamlit
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if hasattr(obj, "nbytes") and not isinstance(obj, type):
+        return int(obj.nbytes)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(sizeof(k, seen) + sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(sizeof(v, seen) for v in obj)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        size += sizeof(vars(obj), seen)
+    return size
+
+
+class SessionMonitor:
+    """Dernière activité, valeurs de session mesurées et objets reconstructibles, par session."""
+
+    def __init__(self, idle_seconds, clock=time.time):
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        self._sessions = {}   # session -> {"user", "page", "last_seen", "state_bytes", "compacted"}
+        self._objects = {}    # session -> {nom: objet}
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.compactions = 0
+        self.freed_bytes = 0
+
+    def touch(self, session, user, page, state_bytes):
+        with self._lock:
+            self._sessions[session] = {
+                "user": user, "page": page, "last_seen": self.clock(),
+                "state_bytes": state_bytes, "compacted": False,
+            }
+
+    def get_object(self, session, name):
+        with self._lock:
+            return self._objects.get(session, {}).get(name)
+
+    def put_object(self, session, name, obj):
+        with self._lock:
+            self._objects.setdefault(session, {})[name] = obj
+
+    def object_bytes(self, session):
+        with self._lock:
+            objects = list(self._objects.get(session, {}).values())
+        return sum(sizeof(obj) for obj in objects)
+
+    def sessions(self):
+        with self._lock:
+            return {session: dict(info) for session, info in self._sessions.items()}
+
+    def forget(self, session):
+        with self._lock:
+            self._sessions.pop(session, None)
+            self._objects.pop(session, None)
+
+    def compact(self, session):
+        """Libère les objets lourds de la session ; retourne les octets libérés (estimés)."""
+        freed = self.object_bytes(session) + registry.compact(session)
+        with self._lock:
+            self._objects.pop(session, None)
+            if session in self._sessions:
+                self._sessions[session]["compacted"] = True
+            self.compactions += 1
+            self.freed_bytes += freed
+        return freed
+
+    def sweep(self, is_active, force=False):
+        """Oublie les sessions fermées et compacte celles inactives depuis `idle_seconds`."""
+        now = self.clock()
+        with self._lock:
+            if not force and now - self._last_sweep < SWEEP_INTERVAL_S:
+                return 0
+            self._last_sweep = now
+            sessions = list(self._sessions.items())
+        compacted = 0
+        for session, info in sessions:
+            if not is_active(session):
+                self.forget(session)
+                registry.forget(session)
+            elif not info["compacted"] and now - info["last_seen"] >= self.idle_seconds:
+                self.compact(session)
+                compacted += 1
+        return compacted
+
+
+_monitor = SessionMonitor(IDLE_MINUTES * 60)
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def _sweep_forever():
+    while True:
+        time.sleep(SWEEP_INTERVAL_S)
+        try:
+            _monitor.sweep(registry.session_active)
+        except Exception:
+            pass  # ex. disque plein pendant un déchargement : nouvel essai au balayage suivant
+
+
+def _start_sweeper():
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None or not _sweeper.is_alive():
+            _sweeper = threading.Thread(target=_sweep_forever, name="session-sweeper", daemon=True)
+            _sweeper.start()
+
+
+def is_admin(user):
+    return user in ADMINS
+
+
+def track_session(page):
+    """À appeler en haut de chaque page : enregistre l'interaction (le compactage tourne en arrière-plan)."""
+    import streamlit as st
+    state_bytes = sum(sizeof(v) for v in st.session_state.to_dict().values())
+    _monitor.touch(registry.current_session(), st.session_state.get("user"), page, state_bytes)
+    _start_sweeper()
+
+
+def session_object(name, build):
+    """Objet lourd de la session, gardé hors de `st.session_state` ; `build()` le reconstruit s'il a été libéré."""
+    session = registry.current_session()
+    obj = _monitor.get_object(session, name)
+    if obj is None:
+        obj = build()
+        _monitor.put_object(session, name, obj)
+    return obj
+
+
+def replace_session_object(name, obj):
+    _monitor.put_object(registry.current_session(), name, obj)
+
+
+def compact_idle_sessions():
+    """Compactage immédiat (page d'administration), sans attendre le prochain balayage."""
+    return _monitor.sweep(registry.session_active, force=True)
+
+
+def _upload_bytes():
+    """Octets des fichiers importés tenus par Streamlit, par session (gestionnaire mémoire par défaut)."""
+    from streamlit import runtime
+    if not runtime.exists():
+        return {}
+    storage = getattr(runtime.get_instance().uploaded_file_mgr, "file_storage", {})
+    return {session: sum(len(f.data) for f in list(files.values())) for session, files in list(storage.items())}
+
+
+def memory_report():
+    """Une ligne par session suivie : utilisateur, inactivité et mémoire par catégorie (octets)."""
+    uploads = _upload_bytes()
+    now = _monitor.clock()
+    rows = []
+    for session, info in _monitor.sessions().items():
+        usage = registry.session_usage(session)
+        row = {
+            "session": session,
+            "user": info["user"],
+            "page": info["page"],
+            "idle_s": now - info["last_seen"],
+            "compacted": info["compacted"],
+            "uploads": uploads.get(session, 0),
+            "session_state": info["state_bytes"],
+            "objects": _monitor.object_bytes(session),
+            "results": usage["bytes"],
+            "results_on_disk": usage["spilled"],
+            "assembled": usage["assembled_bytes"],
+        }
+        row["total"] = row["uploads"] + row["session_state"] + row["objects"] + row["results"] + row["assembled"]
+        rows.append(row)
+    return sorted(rows, key=lambda r: r["total"], reverse=True)
+
+
+def monitor_stats():
+    return {
+        "sessions": len(_monitor.sessions()),
+        "compactions": _monitor.compactions,
+        "freed_bytes": _monitor.freed_bytes,
+        "idle_minutes": IDLE_MINUTES,
+    }
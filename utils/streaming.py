@@ -0,0 +1,87 @@
+"""Agrégation par morceaux des gros exports CSV de ventes.
+
+Le CSV est lu par blocs de lignes ; chaque bloc est réduit à des comptages
+par (offre, commercial, jour) puis fusionné avec les précédents. La mémoire
+occupée dépend du nombre de clés distinctes, pas du nombre de lignes.
+"""
+import io
+
+import pandas as pd
+
+from utils.dates import parse_dates
+from utils.dialect import Dialect, detect_encoding, sniff
+
+CHUNK_ROWS = 200_000
+# Au-delà de cette taille, le mode streaming est proposé par défaut
+STREAMING_THRESHOLD_MB = 50
+
+
+def _dialect(data):
+    dialect = sniff(data)
+    if dialect is None:
+        dialect = Dialect(detect_encoding(bytes(data[:4096])) or "latin-1", ",")
+    return dialect
+
+
+def read_header(data):
+    """Noms de colonnes (nettoyés) sans lire le corps du fichier."""
+    dialect = _dialect(data)
+    head = pd.read_csv(io.BytesIO(data), sep=dialect.sep, encoding=dialect.encoding, nrows=0)
+    return [str(c).strip() for c in head.columns]
+
+
+def iter_chunks(data, usecols, chunksize=CHUNK_ROWS, text_cols=()):
+    """Blocs du CSV ; `text_cols` lues en texte (sinon le type est déduit bloc par bloc)."""
+    dialect = _dialect(data)
+    raw = pd.read_csv(io.BytesIO(data), sep=dialect.sep, encoding=dialect.encoding, nrows=0).columns
+    reader = pd.read_csv(
+        io.BytesIO(data), sep=dialect.sep, encoding=dialect.encoding,
+        usecols=lambda c: str(c).strip() in usecols, chunksize=chunksize,
+        dtype={c: str for c in raw if str(c).strip() in text_cols},
+    )
+    with reader:
+        for chunk in reader:
+            chunk.columns = [str(c).strip() for c in chunk.columns]
+            yield chunk
+
+
+def key_labels(s):
+    """Clé de regroupement en texte (NaN conservés) : mêmes libellés que le fichier soit lu
+    d'un bloc (type déduit sur tout le fichier) ou par morceaux (lu en texte)."""
+    if pd.api.types.is_float_dtype(s) and (s.dropna() % 1 == 0).all():
+        s = s.astype("Int64")  # 101.0 (entiers avec cellules vides) -> "101"
+    return s.astype(str).where(s.notna())
+
+
+def _partial_counts(df, offres_col, comm_col, date_col):
+    dates = parse_dates(df[date_col])
+    return pd.DataFrame({
+        offres_col: key_labels(df[offres_col]),
+        comm_col: key_labels(df[comm_col]),
+        "Jour": dates.dt.normalize(),
+        "n_date": dates.notna().astype("int64"),
+    }).groupby([offres_col, comm_col, "Jour"], dropna=False).agg(n=("n_date", "size"), n_date=("n_date", "sum"))
+
+
+def count_sales(df, offres_col, comm_col, date_col):
+    """Comptages par (offre, commercial, jour) d'un DataFrame déjà en mémoire.
+
+    Colonnes du résultat : offre, commercial (en texte), "Jour" (date
+    normalisée, NaT si invalide), "n" (lignes) et "n_date" (lignes avec une
+    date valide).
+    """
+    return _partial_counts(df, offres_col, comm_col, date_col).reset_index()
+
+
+def stream_counts(data, offres_col, comm_col, date_col, chunksize=CHUNK_ROWS):
+    """Même résultat que count_sales, en lisant le CSV par blocs."""
+    keys = [offres_col, comm_col, "Jour"]
+    partials = []
+    for chunk in iter_chunks(data, {offres_col, comm_col, date_col}, chunksize, text_cols={offres_col, comm_col}):
+        partials.append(_partial_counts(chunk, offres_col, comm_col, date_col))
+        # Fusion régulière : on ne garde jamais plus de quelques tables de comptage
+        if len(partials) >= 8:
+            partials = [pd.concat(partials).groupby(level=keys, dropna=False).sum()]
+    if not partials:
+        return pd.DataFrame(columns=keys + ["n", "n_date"])
+    return pd.concat(partials).groupby(level=keys, dropna=False).sum().reset_index()
@@ -0,0 +1,121 @@
+"""Lecture des fichiers TBO (chiffre d'affaires par produit).
+
+Le classeur est ouvert une seule fois en lecture seule (streaming openpyxl) ;
+la lecture s'arrête dès la ligne de valeurs "Fitness Park"/"Casablanca"
+trouvée, seules les lignes produits et valeurs sont renvoyées. Les produits
+sont ensuite classés en groupes selon les règles de `tbo_groups.json`.
+"""
+import functools
+import json
+import re
+import zipfile
+from io import BytesIO
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+VALUE_ROW_MARKERS = ("Fitness Park", "Casablanca")
+FIRST_PRODUCT_COL = 3
+# À la racine du dépôt, indépendamment du dossier de lancement
+TBO_GROUPS_PATH = Path(__file__).resolve().parent.parent / "tbo_groups.json"
+
+
+def pick_turnover_sheet(sheet_names):
+    for sheet in sheet_names:
+        sheet_lower = sheet.lower()
+        if "chiffre" in sheet_lower or "affaires" in sheet_lower or "ca" in sheet_lower or "ventes" in sheet_lower:
+            return sheet
+    return sheet_names[-1]
+
+
+def _find_rows(rows):
+    """(ligne produits, ligne valeurs) : la ligne valeurs est la première
+    (hors ligne d'en-tête) contenant un marqueur, la ligne produits la précède."""
+    previous = None
+    for i, row in enumerate(rows):
+        if i > 0 and any(isinstance(v, str) and any(m in v for m in VALUE_ROW_MARKERS) for v in row):
+            return list(previous), list(row)
+        previous = row
+    return None, None
+
+
+def read_tbo_rows(data):
+    """(feuille, produits, valeurs) à partir de la colonne D, ou (feuille, None, None)."""
+    try:
+        wb = load_workbook(BytesIO(data), read_only=True, data_only=True)
+    except (InvalidFileException, zipfile.BadZipFile):
+        return _read_tbo_rows_pandas(data)
+    try:
+        sheet = pick_turnover_sheet(wb.sheetnames)
+        ws = wb[sheet]
+        # La balise <dimension> peut être fausse (exports tiers) : on lit toute la feuille
+        ws.reset_dimensions()
+        products, values = _find_rows(ws.iter_rows(values_only=True))
+    finally:
+        wb.close()
+    if products is None:
+        return sheet, None, None
+    return sheet, products[FIRST_PRODUCT_COL:], values[FIRST_PRODUCT_COL:]
+
+
+def _read_tbo_rows_pandas(data):
+    # Anciens formats (.xls) : un seul ExcelFile réutilisé pour lister et lire la feuille
+    with pd.ExcelFile(BytesIO(data)) as xls:
+        sheet = pick_turnover_sheet(xls.sheet_names)
+        df = xls.parse(sheet, header=None)
+    # Recherche vectorisée de la ligne valeurs (hors ligne d'en-tête)
+    pattern = "|".join(map(re.escape, VALUE_ROW_MARKERS))
+    found = df.iloc[1:].apply(lambda col: col.astype(str).str.contains(pattern, regex=True)).any(axis=1)
+    if not found.any():
+        return sheet, None, None
+    value_row = df.index.get_loc(found.idxmax())
+    products = df.iloc[value_row - 1].tolist()
+    values = df.iloc[value_row].tolist()
+    return sheet, products[FIRST_PRODUCT_COL:], values[FIRST_PRODUCT_COL:]
+
+
+class ProductClassifier:
+    """Règles de regroupement produits compilées.
+
+    Chaque groupe (dans l'ordre du fichier, le premier qui correspond gagne)
+    peut définir des codes exacts, des préfixes (sensibles à la casse) et des
+    sous-chaînes (insensibles à la casse). Les codes exacts sont résolus par
+    dictionnaire, préfixes et sous-chaînes par une seule regex par groupe.
+    """
+
+    def __init__(self, rules):
+        self.default = rules["default"]
+        self.groups = [g["name"] for g in rules["groups"]]
+        if self.default not in self.groups:
+            self.groups.append(self.default)
+        self._exact = {}
+        self._patterns = []
+        for rank, group in enumerate(rules["groups"]):
+            for code in group.get("exact", []):
+                self._exact.setdefault(code, rank)
+            alternatives = []
+            if group.get("prefixes"):
+                alternatives.append("^(?:%s)" % "|".join(map(re.escape, group["prefixes"])))
+            if group.get("contains"):
+                alternatives.append("(?i:%s)" % "|".join(map(re.escape, group["contains"])))
+            if alternatives:
+                self._patterns.append((rank, re.compile("|".join(alternatives))))
+        self.classify = functools.lru_cache(maxsize=None)(self._classify)
+
+    def _classify(self, product):
+        rank = self._exact.get(product, len(self.groups))
+        for pattern_rank, pattern in self._patterns:
+            if pattern_rank >= rank:
+                break
+            if pattern.search(product):
+                rank = pattern_rank
+                break
+        return self.groups[rank] if rank < len(self.groups) else self.default
+
+
+@functools.lru_cache(maxsize=None)
+def load_classifier(path=TBO_GROUPS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return ProductClassifier(json.load(f))